@@ -1,7 +1,10 @@
 import pandas as pd
 from sklearn.decomposition import NMF
 from sklearn.metrics.pairwise import cosine_similarity
-from data_preprocessing import merge_data
+from data_preprocessing import genre_filter, fill_ratings
+from memory_monitor import profile_stage, within_budget
+from numeric_config import blas_threads, get_dtype
+from blocked_similarity import CosineKernel, blocked_similarity
 import warnings
 from sklearn.exceptions import ConvergenceWarning
 
@@ -14,52 +17,138 @@ def create_pivot_table(min_ratings=100):
     """
     Creates a pivot table (users x movies) with ratings.
     Only movies with at least min_ratings are retained.
+    The pivot comes from the cached pipeline (see pipeline.py).
     """
-    data = merge_data()
+    # Stages up to the pivot are cached and reused across entry points
+    from pipeline import run_pipeline
 
-    # Count number of ratings per movie
-    ratings_count = data.groupby("title")["rating"].count()
-    popular_movies = ratings_count[ratings_count >= min_ratings].index
-    filtered_data = data[data["title"].isin(popular_movies)]
+    return run_pipeline("pivot", min_ratings=min_ratings)
 
-    # Create pivot table: rows = userId, columns = movie title, values = rating
-    pivot = filtered_data.pivot_table(index="userId", columns="title", values="rating")
-    return pivot
 
-
-def advanced_recommendations(movie_title, pivot, n_components=20, top_n=10):
+def fit_movie_factors(pivot, n_components=20):
     """
-    Generates recommendations using NMF-based matrix factorization.
-    Fills missing ratings with 0, factorizes the matrix, and computes cosine similarities
-    on the movie latent factors.
+    Fits NMF on the pivot (missing ratings filled with 0) and returns the movie
+    latent factors, shape (n_movies, n_components), in the pivot's precision.
     """
     # Fill missing values with 0 (you might also experiment with other strategies)
-    pivot_filled = pivot.fillna(0)
+    pivot_filled = fill_ratings(pivot)
 
     # Apply NMF to factorize the matrix into user and movie latent factors
     nmf_model = NMF(n_components=n_components, init="random", random_state=42)
-    W = nmf_model.fit_transform(pivot_filled)
+    with profile_stage("nmf"), blas_threads():
+        W = nmf_model.fit_transform(pivot_filled)
     H = nmf_model.components_  # shape: (n_components, n_movies)
 
     # Transpose H to get movie latent factors: shape (n_movies, n_components)
-    movie_factors = H.T
-    movie_titles = pivot_filled.columns.tolist()
+    return H.T
 
-    # Compute cosine similarity between movies using the latent factors
-    similarity_matrix = cosine_similarity(movie_factors)
-    similarity_df = pd.DataFrame(
-        similarity_matrix, index=movie_titles, columns=movie_titles
+
+def movie_similarity(movie_factors, movie_titles, top_k=100):
+    """
+    Cosine similarity between all movies' latent factors as a DataFrame. If the
+    full matrix does not fit in the memory budget, a blocked SimilarityIndex of
+    each movie's top_k most similar movies is returned instead. It keeps the
+    (small) factor kernel, so genre-filtered queries compute the movie's full row.
+    """
+    n_movies = len(movie_titles)
+    movie_factors = movie_factors.astype(get_dtype(), copy=False)
+    with profile_stage("similarity"), blas_threads():
+        if within_budget(
+            n_movies * n_movies * movie_factors.dtype.itemsize, "similarity"
+        ):
+            return pd.DataFrame(
+                cosine_similarity(movie_factors),
+                index=movie_titles,
+                columns=movie_titles,
+            )
+        return blocked_similarity(
+            CosineKernel(movie_factors), movie_titles, top_k=top_k, keep_kernel=True
+        )
+
+
+def build_similarity_index(
+    pivot,
+    n_components=20,
+    top_k=50,
+    block_size=512,
+    n_jobs=None,
+    output_path=None,
+    include_genres=None,
+    exclude_genres=None,
+    keep_kernel=False,
+):
+    """
+    Fits NMF once and builds the cosine similarity between all movie latent
+    factors tile by tile with bounded memory. Returns a SimilarityIndex holding
+    each movie's top_k most similar movies, or, if output_path is given, the full
+    matrix in a memory-mapped file. The index can be queried with
+    recommendation_engine.get_recommendations. include_genres/exclude_genres
+    restrict the neighbours kept in a top_k index; genre filters passed to
+    get_recommendations on an unfiltered top_k index only see each movie's
+    top_k neighbours, unless keep_kernel=True keeps the factors so that full
+    rows can be computed on demand.
+    """
+    movie_factors = fit_movie_factors(pivot, n_components)
+    candidates = None
+    if include_genres or exclude_genres:
+        candidates = genre_filter(pivot.columns, include_genres, exclude_genres)
+    return blocked_similarity(
+        CosineKernel(movie_factors),
+        pivot.columns,
+        top_k=top_k,
+        block_size=block_size,
+        n_jobs=n_jobs,
+        output_path=output_path,
+        candidates=candidates,
+        keep_kernel=keep_kernel,
     )
 
-    if movie_title not in similarity_df.index:
+
+def advanced_recommendations(
+    movie_title,
+    pivot,
+    n_components=20,
+    top_n=10,
+    include_genres=None,
+    exclude_genres=None,
+):
+    """
+    Generates recommendations using NMF-based matrix factorization.
+    Fills missing ratings with 0, factorizes the matrix, and computes cosine similarities
+    on the movie latent factors. include_genres/exclude_genres restrict the candidates
+    by genre before the top_n selection.
+    """
+    movie_factors = fit_movie_factors(pivot, n_components)
+    movie_titles = pivot.columns.tolist()
+
+    if movie_title not in movie_titles:
         raise ValueError(f"Movie '{movie_title}' not found in the dataset.")
 
-    # Get the similarity series for the given movie and sort descending
-    similar_movies = (
-        similarity_df[movie_title]
-        .drop(labels=[movie_title])
-        .sort_values(ascending=False)
-    )
+    # Compute cosine similarity between movies using the latent factors.
+    # Without room for the full (n_movies x n_movies) matrix, only the
+    # selected movie's similarities are computed.
+    with profile_stage("similarity"), blas_threads():
+        n_movies = len(movie_titles)
+        if within_budget(
+            n_movies * n_movies * movie_factors.dtype.itemsize, "similarity"
+        ):
+            similarity_matrix = cosine_similarity(movie_factors)
+            similarity_df = pd.DataFrame(
+                similarity_matrix, index=movie_titles, columns=movie_titles
+            )
+            similarities = similarity_df[movie_title]
+        else:
+            target = movie_factors[[movie_titles.index(movie_title)]]
+            similarities = pd.Series(
+                cosine_similarity(movie_factors, target).ravel(),
+                index=movie_titles,
+                name=movie_title,
+            )
+
+    # Mask out the movie itself and genre mismatches, then sort descending
+    keep = genre_filter(similarities.index, include_genres, exclude_genres)
+    keep &= similarities.index != movie_title
+    similar_movies = similarities[keep].sort_values(ascending=False)
     recommendations = similar_movies.head(top_n)
     return recommendations
 
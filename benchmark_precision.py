@@ -0,0 +1,169 @@
+# benchmark_precision.py
+import argparse
+import numpy as np
+import pandas as pd
+import memory_monitor
+from memory_monitor import profile_stage
+from numeric_config import set_blas_threads, set_precision
+from data_preprocessing import merge_data, filter_popular, pivot_ratings
+from advanced_recommender import fit_movie_factors, movie_similarity
+from recommendation_engine import compute_similarity_blocked
+from logger import logger
+
+# Size of the bundled MovieLens 100k data, scaled up for the synthetic dataset
+BUNDLED_USERS, BUNDLED_MOVIES, BUNDLED_RATINGS = 943, 1682, 100000
+
+
+def synthetic_ratings(scale=2.0, seed=42):
+    """
+    Synthetic merged ratings (userId, title, rating) with scale times the users
+    and movies of the bundled data at the same density. Users and movies are
+    drawn with heavy-tailed activity/popularity, and ratings come from a
+    low-rank model plus noise so the factorization has structure to find.
+    """
+    rng = np.random.default_rng(seed)
+    n_users = int(BUNDLED_USERS * scale)
+    n_movies = int(BUNDLED_MOVIES * scale)
+    n_ratings = int(BUNDLED_RATINGS * scale**2)
+
+    user_weights = rng.pareto(2.0, n_users) + 1
+    movie_weights = rng.pareto(1.2, n_movies) + 1
+    users = rng.choice(n_users, n_ratings, p=user_weights / user_weights.sum())
+    movies = rng.choice(n_movies, n_ratings, p=movie_weights / movie_weights.sum())
+    # One rating per (user, movie) pair
+    pairs = np.unique(users.astype(np.int64) * n_movies + movies)
+    users, movies = pairs // n_movies, pairs % n_movies
+
+    user_factors = rng.normal(size=(n_users, 5))
+    movie_factors = rng.normal(size=(n_movies, 5))
+    scores = np.einsum("ij,ij->i", user_factors[users], movie_factors[movies])
+    scores += rng.normal(size=len(scores))
+    ratings = np.clip(np.round(3.5 + scores / scores.std()), 1, 5)
+
+    titles = pd.Index([f"Movie {k:05d}" for k in range(n_movies)])
+    return pd.DataFrame(
+        {"userId": users + 1, "title": titles[movies], "rating": ratings}
+    )
+
+
+def run_stages(data, precision, n_components=20, min_periods=100, top_k=50):
+    """
+    Runs pivot -> NMF -> cosine similarity -> blocked Pearson correlation in the
+    given precision and returns the per-stage measurements, the sizes of the
+    stage outputs and the similarity matrix.
+    """
+    set_precision(precision)
+    memory_monitor.stage_report(reset=True)
+    pivot = pivot_ratings(data)
+    movie_factors = fit_movie_factors(pivot, n_components)
+    similarity = movie_similarity(movie_factors, pivot.columns.tolist())
+    with profile_stage("blocked_correlation"):
+        correlation = compute_similarity_blocked(
+            pivot, min_periods=min_periods, top_k=top_k
+        )
+    report = memory_monitor.stage_report(reset=True)
+    sizes = {
+        "pivot": pivot.to_numpy().nbytes,
+        "movie_factors": movie_factors.nbytes,
+        "similarity": similarity.to_numpy().nbytes,
+        "correlation_top_k": correlation.top_scores.nbytes
+        + correlation.top_indices.nbytes,
+    }
+    return report, sizes, similarity
+
+
+def top_n_overlap(similarity_a, similarity_b, top_n=10):
+    """
+    Average share of each movie's top_n most similar movies (excluding itself)
+    that two similarity matrices agree on.
+    """
+    a = similarity_a.to_numpy(dtype=float, copy=True)
+    b = similarity_b.to_numpy(dtype=float, copy=True)
+    np.fill_diagonal(a, -np.inf)
+    np.fill_diagonal(b, -np.inf)
+    top_a = np.argpartition(-a, top_n, axis=1)[:, :top_n]
+    top_b = np.argpartition(-b, top_n, axis=1)[:, :top_n]
+    shared = [len(np.intersect1d(x, y)) for x, y in zip(top_a, top_b)]
+    return np.mean(shared) / top_n
+
+
+def compare_precisions(name, data, repeat=3, **stage_params):
+    """
+    Benchmarks data in float64 and float32, alternating between them repeat
+    times, and returns a per-stage comparison of the median wall time and peak
+    traced memory. Also prints the output sizes and how well the float32
+    recommendations agree with the float64 ones.
+    """
+    results = {}
+    reports = {"float64": [], "float32": []}
+    for _ in range(repeat):
+        for precision in reports:
+            logger.info("Benchmarking %s data in %s...", name, precision)
+            results[precision] = run_stages(data, precision, **stage_params)
+            reports[precision].append(results[precision][0])
+
+    stages = {}
+    for precision, runs in reports.items():
+        stages[precision] = (
+            pd.concat(runs)
+            .groupby("stage", sort=False)[["seconds", "peak_mb"]]
+            .median()
+        )
+    comparison = pd.concat(stages, axis=1)
+    comparison.columns = [f"{column}_{precision}" for precision, column in comparison]
+    comparison["speedup"] = (
+        comparison["seconds_float64"] / comparison["seconds_float32"]
+    )
+    comparison["memory_ratio"] = (
+        comparison["peak_mb_float32"] / comparison["peak_mb_float64"]
+    )
+
+    sizes = pd.DataFrame(
+        {precision: sizes for precision, (_, sizes, _) in results.items()}
+    )
+    sizes = sizes / 1024**2
+    sizes.columns = [f"{precision}_mb" for precision in sizes.columns]
+
+    overlap = top_n_overlap(results["float64"][2], results["float32"][2])
+    print(
+        f"\n=== {name}: {data['userId'].nunique()} users x "
+        f"{data['title'].nunique()} movies, {len(data)} ratings ==="
+    )
+    print(comparison.to_string(float_format="%.3f"))
+    print("\nOutput sizes (MB):")
+    print(sizes.to_string(float_format="%.2f"))
+    print(f"\nTop-10 similar movies shared between float32 and float64: {overlap:.1%}")
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare float32 and float64 throughput and memory per stage."
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=4.0,
+        help="users/movies of the synthetic data relative to the bundled data",
+    )
+    parser.add_argument("--min-ratings", type=int, default=100)
+    parser.add_argument("--min-periods", type=int, default=100)
+    parser.add_argument("--n-components", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--blas-threads", type=int, default=None)
+    args = parser.parse_args()
+
+    set_blas_threads(args.blas_threads)
+    memory_monitor.enable_profiling()
+    datasets = {
+        "bundled": merge_data(),
+        f"synthetic x{args.scale:g}": synthetic_ratings(args.scale),
+    }
+    for name, data in datasets.items():
+        compare_precisions(
+            name,
+            filter_popular(data, args.min_ratings),
+            repeat=args.repeat,
+            n_components=args.n_components,
+            min_periods=args.min_periods,
+        )
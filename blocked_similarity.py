@@ -0,0 +1,359 @@
+# blocked_similarity.py
+import copy
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from numeric_config import (
+    blas_threads,
+    get_dtype,
+    get_worker_count,
+    set_blas_threads,
+    worker_blas_threads,
+)
+
+
+def pearson_from_sums(n, sum_x, sum_y, sumsq_x, sumsq_y, cross, min_periods):
+    """
+    Pearson correlations from co-counts and sums over the common raters,
+    NaN where fewer than min_periods raters are shared.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = cross - sum_x * sum_y / n
+        var_x = sumsq_x - sum_x**2 / n
+        var_y = sumsq_y - sum_y**2 / n
+        corr = cov / np.sqrt(var_x * var_y)
+    corr = np.clip(corr, -1.0, 1.0)
+    corr[n < min_periods] = np.nan
+    return corr
+
+
+def _tile_diagonal(rows, cols):
+    """
+    Positions within the (rows x cols) tile where an item meets itself.
+    """
+    own = np.arange(rows.start, rows.stop)
+    in_tile = (own >= cols.start) & (own < cols.stop)
+    return np.flatnonzero(in_tile), own[in_tile] - cols.start
+
+
+class _MappedArray:
+    """
+    Stands in for a memory-mapped kernel array when the kernel is pickled, so
+    that worker processes map the .npy file instead of receiving a copy.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+
+class _SharedArrays:
+    """
+    Base class of the kernels. share() moves the arrays named in _arrays into
+    .npy files and memory-maps them; a shared kernel pickles to the file paths
+    only, so every worker process maps the same pages.
+    """
+
+    _arrays = ()
+
+    def share(self, directory):
+        for name in self._arrays:
+            path = os.path.join(directory, f"{name}.npy")
+            np.save(path, getattr(self, name))
+            setattr(self, name, np.load(path, mmap_mode="r"))
+        return self
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in self._arrays:
+            if isinstance(state[name], np.memmap):
+                state[name] = _MappedArray(state[name].filename)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            if isinstance(value, _MappedArray):
+                state[name] = np.load(value.path, mmap_mode="r")
+        self.__dict__.update(state)
+
+
+class CosineKernel(_SharedArrays):
+    """
+    Cosine similarity tiles between the rows of an (items x features) matrix,
+    computed in the configured precision (see numeric_config).
+    """
+
+    _arrays = ("normalized",)
+
+    def __init__(self, factors):
+        factors = np.asarray(factors, dtype=get_dtype())
+        norms = np.linalg.norm(factors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.normalized = factors / norms
+        self.n_items = factors.shape[0]
+        self.dtype = factors.dtype
+
+    def tile(self, rows, cols):
+        return self.normalized[rows] @ self.normalized[cols].T
+
+
+class PearsonKernel(_SharedArrays):
+    """
+    Pairwise-complete Pearson correlation tiles between the columns of a
+    (users x items) rating matrix, matching
+    DataFrame.corr(method="pearson", min_periods=min_periods), computed in the
+    configured precision (see numeric_config).
+
+    ratings is a scipy.sparse matrix of the observed ratings, such as those
+    returned by fill_ratings, sparse_ratings or load_sparse_ratings. Only its
+    non-zero entries are stored (in CSC layout), and a tile densifies just the
+    (users x cols) side, so memory scales with the number of ratings rather
+    than users x items.
+    """
+
+    _arrays = ("data", "indices", "indptr")
+
+    def __init__(self, ratings, min_periods=100):
+        ratings = sparse.csc_matrix(ratings, dtype=get_dtype())
+        ratings.sum_duplicates()
+        self.data = ratings.data
+        self.indices = ratings.indices
+        self.indptr = ratings.indptr
+        self.n_users, self.n_items = ratings.shape
+        self.min_periods = min_periods
+        self.dtype = ratings.dtype
+
+    def _columns(self, cols):
+        """
+        Sparse (users x cols) matrices of the ratings of the columns and of
+        ones where they were rated.
+        """
+        start, stop = self.indptr[cols.start], self.indptr[cols.stop]
+        structure = (
+            np.asarray(self.indices[start:stop]),
+            np.asarray(self.indptr[cols.start : cols.stop + 1]) - start,
+        )
+        shape = (self.n_users, cols.stop - cols.start)
+        data = np.asarray(self.data[start:stop])
+        filled = sparse.csc_matrix((data, *structure), shape=shape)
+        rated = sparse.csc_matrix((np.ones_like(data), *structure), shape=shape)
+        return rated, filled
+
+    def tile(self, rows, cols):
+        rated_a, filled_a = self._columns(rows)
+        squared_a = filled_a.multiply(filled_a)
+        rated_b, filled_b = (matrix.toarray() for matrix in self._columns(cols))
+        corr = pearson_from_sums(
+            n=rated_a.T @ rated_b,
+            sum_x=filled_a.T @ rated_b,
+            sum_y=rated_a.T @ filled_b,
+            sumsq_x=squared_a.T @ rated_b,
+            sumsq_y=rated_a.T @ filled_b**2,
+            cross=filled_a.T @ filled_b,
+            min_periods=self.min_periods,
+        )
+        # pandas reports exactly 1.0 on the diagonal
+        diagonal = _tile_diagonal(rows, cols)
+        corr[diagonal] = np.where(np.isnan(corr[diagonal]), np.nan, 1.0)
+        return corr
+
+
+class SimilarityIndex:
+    """
+    Result of blocked_similarity: either the top_k neighbours of every item or
+    the full similarity matrix spilled to a memory-mapped .npy file. Exposes
+    columns and item access so it can be passed to get_recommendations in place
+    of a similarity/correlation DataFrame.
+
+    A top_k index only holds each item's top_k neighbours, so filtering them
+    afterwards (e.g. by genre) can leave fewer than top_n results. Build the
+    index with the same candidates instead, or keep the kernel so that
+    full_row can compute an item's exact similarities on demand.
+    """
+
+    def __init__(
+        self, titles, top_indices=None, top_scores=None, matrix=None, kernel=None
+    ):
+        self.columns = pd.Index(titles)
+        self.top_indices = top_indices
+        self.top_scores = top_scores
+        self.matrix = matrix
+        self.kernel = kernel
+
+    def full_row(self, movie_title):
+        """
+        Returns the similarities between movie_title and every item, read from
+        the memory-mapped matrix or computed with the kept kernel.
+        """
+        if movie_title not in self.columns:
+            raise ValueError(f"Movie '{movie_title}' not found in the dataset.")
+        if self.matrix is not None:
+            return self[movie_title]
+        if self.kernel is None:
+            raise ValueError("Full rows need the matrix or the kernel of the index.")
+        k = self.columns.get_loc(movie_title)
+        # Computed as a column, which only densifies movie_title's side of the
+        # tile; the similarities are symmetric
+        with blas_threads():
+            row = self.kernel.tile(slice(0, len(self.columns)), slice(k, k + 1))
+        return pd.Series(row.ravel(), index=self.columns, name=movie_title)
+
+    def __getitem__(self, movie_title):
+        if movie_title not in self.columns:
+            raise ValueError(f"Movie '{movie_title}' not found in the dataset.")
+        k = self.columns.get_loc(movie_title)
+        if self.matrix is not None:
+            # Similarity matrices are symmetric, so reading the row reads the column
+            return pd.Series(
+                np.array(self.matrix[k]), index=self.columns, name=movie_title
+            )
+        scores = self.top_scores[k]
+        found = np.isfinite(scores)
+        return pd.Series(
+            scores[found],
+            index=self.columns[self.top_indices[k][found]],
+            name=movie_title,
+        )
+
+
+# Kernel and candidate mask shared with worker processes, set once per
+# process by _init_worker
+_kernel = None
+_candidates = None
+
+
+def _init_worker(kernel, threads=None, candidates=None):
+    global _kernel, _candidates
+    _kernel = kernel
+    _candidates = candidates
+    if threads is not None:
+        # Worker processes split the BLAS threads between them
+        set_blas_threads(threads)
+
+
+def _process_row_block(task):
+    """
+    Streams over the column tiles for one block of rows. Either keeps a running
+    top_k per row (returned) or writes each tile into the memory-mapped output.
+    """
+    start, stop, block_size, top_k, output_path = task
+    rows = slice(start, stop)
+    n_items = _kernel.n_items
+    output = np.load(output_path, mmap_mode="r+") if output_path is not None else None
+    best_scores = np.full((stop - start, 0), -np.inf, dtype=_kernel.dtype)
+    best_indices = np.empty((stop - start, 0), dtype=np.int64)
+
+    for col_start in range(0, n_items, block_size):
+        col_stop = min(col_start + block_size, n_items)
+        with blas_threads():
+            tile = _kernel.tile(rows, slice(col_start, col_stop))
+        if output is not None:
+            output[start:stop, col_start:col_stop] = tile
+            continue
+
+        # Exclude each item itself, missing similarities and non-candidates
+        # from its neighbours before the top_k cut
+        tile = np.where(np.isnan(tile), -np.inf, tile)
+        tile[_tile_diagonal(rows, slice(col_start, col_stop))] = -np.inf
+        if _candidates is not None:
+            tile[:, ~_candidates[col_start:col_stop]] = -np.inf
+
+        scores = np.hstack([best_scores, tile])
+        indices = np.hstack(
+            [
+                best_indices,
+                np.broadcast_to(
+                    np.arange(col_start, col_stop), (stop - start, col_stop - col_start)
+                ),
+            ]
+        )
+        if scores.shape[1] > top_k:
+            keep = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+            scores = np.take_along_axis(scores, keep, axis=1)
+            indices = np.take_along_axis(indices, keep, axis=1)
+        best_scores, best_indices = scores, indices
+
+    if output is not None:
+        output.flush()
+        return start, None, None
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return (
+        start,
+        np.take_along_axis(best_indices, order, axis=1),
+        np.take_along_axis(best_scores, order, axis=1),
+    )
+
+
+def blocked_similarity(
+    kernel,
+    titles,
+    top_k=50,
+    block_size=512,
+    n_jobs=None,
+    output_path=None,
+    candidates=None,
+    keep_kernel=False,
+):
+    """
+    Builds an item x item similarity index tile by tile so that no more than
+    (block_size x block_size) similarities are held in memory at once.
+
+    By default only the top_k most similar items of each row are kept while
+    streaming over the tiles. If output_path is given, every tile is instead
+    written to a memory-mapped .npy file holding the full matrix. Row blocks
+    are processed in parallel across n_jobs worker processes when n_jobs > 1
+    (n_jobs=None uses the configured worker count, see numeric_config), each
+    limited to its share of the BLAS threads. The workers memory-map the
+    kernel's arrays from a temporary directory instead of receiving copies.
+
+    candidates is an optional boolean mask over the items; only candidate items
+    are kept as neighbours, so a filtered query still gets up to top_k results.
+    With keep_kernel=True the index keeps the kernel for SimilarityIndex.full_row.
+    """
+    n_items = kernel.n_items
+    n_jobs = get_worker_count() if n_jobs is None else n_jobs
+    if output_path is not None:
+        np.lib.format.open_memmap(
+            output_path, mode="w+", dtype=kernel.dtype, shape=(n_items, n_items)
+        ).flush()
+    tasks = [
+        (start, min(start + block_size, n_items), block_size, top_k, output_path)
+        for start in range(0, n_items, block_size)
+    ]
+
+    if candidates is not None:
+        candidates = np.asarray(candidates, dtype=bool)
+    if n_jobs == 1:
+        _init_worker(kernel, candidates=candidates)
+        results = [_process_row_block(task) for task in tasks]
+    else:
+        # Workers memory-map a shared copy of the kernel's arrays rather than
+        # each unpickling its own copy
+        with tempfile.TemporaryDirectory() as directory:
+            shared = copy.copy(kernel).share(directory)
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                initializer=_init_worker,
+                initargs=(shared, worker_blas_threads(n_jobs), candidates),
+            ) as executor:
+                results = list(executor.map(_process_row_block, tasks))
+            del shared
+
+    if output_path is not None:
+        return SimilarityIndex(titles, matrix=np.load(output_path, mmap_mode="r"))
+
+    width = min(top_k, n_items)
+    top_indices = np.zeros((n_items, width), dtype=np.int64)
+    top_scores = np.full((n_items, width), -np.inf, dtype=kernel.dtype)
+    for start, indices, scores in results:
+        stop = start + indices.shape[0]
+        top_indices[start:stop, : indices.shape[1]] = indices
+        top_scores[start:stop, : scores.shape[1]] = scores
+    return SimilarityIndex(
+        titles,
+        top_indices=top_indices,
+        top_scores=top_scores,
+        kernel=kernel if keep_kernel else None,
+    )
@@ -0,0 +1,132 @@
+# cold_start.py
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from data_preprocessing import merge_data, load_users
+from logger import logger
+
+# Age bucket edges (lower bounds) and labels, following the MovieLens 1M grouping
+AGE_BINS = [0, 18, 25, 35, 45, 50, 56, np.inf]
+AGE_LABELS = ["<18", "18-24", "25-34", "35-44", "45-49", "50-55", "56+"]
+
+# Segment levels from most to least specific; lookups fall back along this list
+SEGMENT_LEVELS = [
+    ("age_bucket", "gender", "occupation"),
+    ("age_bucket", "gender"),
+    ("age_bucket",),
+    ("gender",),
+    (),
+]
+
+
+def age_bucket(age):
+    """
+    Maps an age (scalar or array-like) to its age bucket label.
+    """
+    buckets = pd.cut(np.atleast_1d(age), bins=AGE_BINS, labels=AGE_LABELS, right=False)
+    return buckets[0] if np.isscalar(age) else buckets
+
+
+def build_segment_rankings(
+    prior_weight=20,
+    min_segment_ratings=500,
+    top_n=50,
+    output_file="segment_rankings.pkl",
+):
+    """
+    Precomputes Bayesian-averaged popularity rankings for every demographic segment
+    (age bucket x gender x occupation, plus coarser fallback segments).
+
+    Within a segment each movie is scored as
+        (prior_weight * segment_mean + sum_of_ratings) / (prior_weight + n_ratings)
+    so movies with few ratings are pulled towards the segment's mean rating.
+    Segments with fewer than min_segment_ratings ratings are skipped and served by
+    a coarser level instead. The rankings are saved to output_file and returned as
+    a dict mapping (level, segment values) to a list of (title, score).
+    """
+    users = load_users()
+    users["age_bucket"] = age_bucket(users["age"])
+    data = merge_data().merge(
+        users[["userId", "age_bucket", "gender", "occupation"]], on="userId"
+    )
+
+    rankings = {}
+    for level in SEGMENT_LEVELS:
+        keys = list(level)
+        per_movie = (
+            data.groupby(keys + ["title"], observed=True)["rating"]
+            .agg(["count", "sum"])
+            .reset_index()
+        )
+        if keys:
+            grouped = per_movie.groupby(keys, observed=True)
+            segment_count = grouped["count"].transform("sum")
+            segment_sum = grouped["sum"].transform("sum")
+        else:
+            segment_count = pd.Series(per_movie["count"].sum(), index=per_movie.index)
+            segment_sum = pd.Series(per_movie["sum"].sum(), index=per_movie.index)
+
+        eligible = segment_count >= min_segment_ratings
+        per_movie = per_movie[eligible]
+        segment_mean = segment_sum[eligible] / segment_count[eligible]
+        per_movie["score"] = (prior_weight * segment_mean + per_movie["sum"]) / (
+            prior_weight + per_movie["count"]
+        )
+
+        per_movie = per_movie.sort_values("score", ascending=False, kind="stable")
+        if not keys:
+            top = per_movie.head(top_n)
+            rankings[(level, ())] = list(zip(top["title"], top["score"]))
+            continue
+        top = per_movie.groupby(keys, observed=True).head(top_n)
+        for segment, group in top.groupby(keys, observed=True):
+            rankings[(level, segment)] = list(zip(group["title"], group["score"]))
+
+    joblib.dump(rankings, output_file)
+    logger.info(
+        "Saved rankings for %d demographic segments to %s", len(rankings), output_file
+    )
+    return rankings
+
+
+def load_segment_rankings(rankings_file="segment_rankings.pkl"):
+    """
+    Loads precomputed segment rankings, building them first if they do not exist.
+    """
+    if not os.path.exists(rankings_file):
+        return build_segment_rankings(output_file=rankings_file)
+    return joblib.load(rankings_file)
+
+
+def cold_start_recommendations(
+    rankings, age=None, gender=None, occupation=None, top_n=10
+):
+    """
+    Returns top_n recommendations for a user with no ratings, based on their
+    demographics. Unknown attributes (None) are skipped, and the most specific
+    precomputed segment matching the given attributes is used.
+    """
+    profile = {
+        "age_bucket": age_bucket(age) if age is not None else None,
+        "gender": gender,
+        "occupation": occupation,
+    }
+    for level in SEGMENT_LEVELS:
+        segment = tuple(profile[key] for key in level)
+        if None in segment:
+            continue
+        ranking = rankings.get((level, segment))
+        if ranking is not None:
+            titles, scores = zip(*ranking[:top_n])
+            return pd.Series(scores, index=titles, name="score")
+    raise ValueError("No segment rankings available; rebuild the rankings file.")
+
+
+if __name__ == "__main__":
+    rankings = build_segment_rankings()
+    recs = cold_start_recommendations(
+        rankings, age=24, gender="M", occupation="technician"
+    )
+    print("Cold-start recommendations for a 24 year old male technician:")
+    print(recs)
@@ -1,6 +1,33 @@
 # data_preprocessing.py
 import pandas as pd
+import numpy as np
 import os
+from functools import lru_cache
+from memory_monitor import profile_stage, within_budget
+from numeric_config import get_dtype
+
+# Genre flag columns of u.item, in bit order (see data/u.genre)
+GENRES = [
+    "unknown",
+    "Action",
+    "Adventure",
+    "Animation",
+    "Children's",
+    "Comedy",
+    "Crime",
+    "Documentary",
+    "Drama",
+    "Fantasy",
+    "Film-Noir",
+    "Horror",
+    "Musical",
+    "Mystery",
+    "Romance",
+    "Sci-Fi",
+    "Thriller",
+    "War",
+    "Western",
+]
 
 
 def load_ratings(ratings_path="data/u.data"):
@@ -16,7 +43,6 @@ def load_ratings(ratings_path="data/u.data"):
         ratings_path,
         sep="\t",
         names=["userId", "movieId", "rating", "timestamp"],
-        engine="python",
     )
     return ratings
 
@@ -26,7 +52,8 @@ def load_movies(movies_path="data/u.item"):
     Loads movie data from the MovieLens 100k dataset.
     Expected file is pipe-separated with columns:
     movieId | title | release_date | video_release_date | IMDb_URL | [genre flags...]
-    For simplicity, only movieId and title are extracted.
+    Only movieId and title are kept, plus genre_mask: the 19 genre flags packed
+    into one integer where bit i is set if the movie belongs to GENRES[i].
     """
     if not os.path.exists(movies_path):
         raise FileNotFoundError(
@@ -44,42 +71,420 @@ def load_movies(movies_path="data/u.item"):
             "release_date",
             "video_release_date",
             "IMDb_URL",
-            "unknown",
-            "Action",
-            "Adventure",
-            "Animation",
-            "Children's",
-            "Comedy",
-            "Crime",
-            "Documentary",
-            "Drama",
-            "Fantasy",
-            "Film-Noir",
-            "Horror",
-            "Musical",
-            "Mystery",
-            "Romance",
-            "Sci-Fi",
-            "Thriller",
-            "War",
-            "Western",
-        ],
+        ]
+        + GENRES,
     )
-    # Keep only movieId and title for our recommendation purposes.
-    movies = movies[["movieId", "title"]]
+    # Pack the genre flags into a bitmask, then keep only what we need.
+    flags = movies[GENRES].to_numpy(dtype=np.uint32)
+    bits = np.arange(len(GENRES), dtype=np.uint32)
+    movies["genre_mask"] = np.bitwise_or.reduce(flags << bits, axis=1)
+    movies = movies[["movieId", "title", "genre_mask"]]
     return movies
 
 
-def merge_data():
+def genre_bitmask(genres):
+    """
+    Converts a list of genre names into a bitmask compatible with genre_mask.
+    """
+    mask = 0
+    for genre in genres or []:
+        if genre not in GENRES:
+            raise ValueError(f"Unknown genre '{genre}'. Expected one of {GENRES}.")
+        mask |= 1 << GENRES.index(genre)
+    return mask
+
+
+@lru_cache(maxsize=None)
+def load_title_genre_masks(movies_path="data/u.item"):
+    """
+    Returns a Series mapping movie title to its genre bitmask.
+    Titles shared by several movieIds get the union of their genres.
+    """
+    movies = load_movies(movies_path)
+    return movies.groupby("title")["genre_mask"].agg(np.bitwise_or.reduce)
+
+
+def genre_filter(titles, include_genres=None, exclude_genres=None):
+    """
+    Returns a boolean array over titles that is True for movies matching at
+    least one of include_genres (if given) and none of exclude_genres.
+    """
+    keep = np.ones(len(titles), dtype=bool)
+    if not include_genres and not exclude_genres:
+        return keep
+    masks = (
+        load_title_genre_masks().reindex(titles, fill_value=0).to_numpy(dtype=np.uint32)
+    )
+    if include_genres:
+        keep &= (masks & genre_bitmask(include_genres)) != 0
+    if exclude_genres:
+        keep &= (masks & genre_bitmask(exclude_genres)) == 0
+    return keep
+
+
+def load_occupations(occupations_path="data/u.occupation"):
+    """
+    Loads the list of occupations from the MovieLens 100k dataset.
+    Expected file has one occupation name per line.
+    """
+    if not os.path.exists(occupations_path):
+        raise FileNotFoundError(
+            f"Could not find {occupations_path}. Please ensure the file is in the data folder."
+        )
+    with open(occupations_path, encoding="latin-1") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def load_users(users_path="data/u.user", occupations_path="data/u.occupation"):
+    """
+    Loads user demographics from the MovieLens 100k dataset.
+    Expected file is pipe-separated with columns: userId | age | gender | occupation | zip.
+    Occupation is returned as a categorical over the values in u.occupation.
+    """
+    if not os.path.exists(users_path):
+        raise FileNotFoundError(
+            f"Could not find {users_path}. Please ensure the file is in the data folder."
+        )
+    users = pd.read_csv(
+        users_path,
+        sep="|",
+        encoding="latin-1",
+        header=None,
+        names=["userId", "age", "gender", "occupation", "zip"],
+        dtype={"zip": str},
+    )
+    users["occupation"] = pd.Categorical(
+        users["occupation"], categories=load_occupations(occupations_path)
+    )
+    return users
+
+
+# Compact dtypes used when streaming the larger MovieLens rating files
+RATING_DTYPES = {
+    "userId": np.int32,
+    "movieId": np.int32,
+    "rating": np.float32,
+    "timestamp": np.int64,
+}
+
+# Genre names used by ML-10M/20M/25M that differ from the 100k/1M ones
+GENRE_ALIASES = {"Children": "Children's", "(no genres listed)": "unknown"}
+
+
+def iter_ratings(ratings_path, chunksize=1_000_000):
+    """
+    Streams a MovieLens ratings file in chunks of chunksize rows, each a DataFrame
+    with compact userId, movieId, rating and timestamp columns. Supported layouts:
+      - u.data / *.base / *.test (100k): tab-separated, no header
+      - ratings.dat (1M/10M): UserID::MovieID::Rating::Timestamp
+      - ratings.csv (20M/25M): userId,movieId,rating,timestamp with a header
+    All are parsed with pandas' C engine.
+    """
+    if not os.path.exists(ratings_path):
+        raise FileNotFoundError(
+            f"Could not find {ratings_path}. Please ensure the file is in the data folder."
+        )
+    columns = list(RATING_DTYPES)
+    if ratings_path.endswith(".dat"):
+        # "::" would need the slow python engine; splitting on ":" leaves empty
+        # fields between the values, which usecols skips.
+        options = dict(sep=":", header=None, usecols=[0, 2, 4, 6])
+    elif ratings_path.endswith(".csv"):
+        options = dict(sep=",", header=0, usecols=columns)
+    else:
+        options = dict(sep="\t", header=None)
+
+    reader = pd.read_csv(ratings_path, chunksize=chunksize, **options)
+    for chunk in reader:
+        if options["header"] is None:
+            chunk.columns = columns
+        yield chunk[columns].astype(RATING_DTYPES)
+
+
+def load_sparse_ratings(ratings_path, chunksize=1_000_000, min_ratings=0):
+    """
+    Loads a MovieLens ratings file of any supported layout (see iter_ratings)
+    straight into a sparse (users x movies) CSR matrix.
+
+    Each chunk is reduced to compact NumPy arrays as it is read, so the full
+    ratings file is never held as a DataFrame. User and movie ids are encoded to
+    contiguous row/column positions; movies with fewer than min_ratings ratings
+    are dropped. Returns (matrix, user_ids, movie_ids) where user_ids[i] and
+    movie_ids[j] are the original ids of row i and column j.
+    """
+    from scipy import sparse
+
+    users, movies, ratings = [], [], []
+    with profile_stage("load"):
+        for chunk in iter_ratings(ratings_path, chunksize):
+            users.append(chunk["userId"].to_numpy())
+            movies.append(chunk["movieId"].to_numpy())
+            ratings.append(chunk["rating"].to_numpy())
+        users = np.concatenate(users)
+        movies = np.concatenate(movies)
+        ratings = np.concatenate(ratings)
+
+    with profile_stage("encode"):
+        user_ids, rows = np.unique(users, return_inverse=True)
+        movie_ids, cols = np.unique(movies, return_inverse=True)
+        del users, movies
+        if min_ratings > 0:
+            popular = np.bincount(cols, minlength=len(movie_ids)) >= min_ratings
+            kept = popular[cols]
+            new_positions = np.cumsum(popular) - 1
+            rows, cols, ratings = rows[kept], new_positions[cols[kept]], ratings[kept]
+            movie_ids = movie_ids[popular]
+
+    with profile_stage("sparse"):
+        matrix = sparse.csr_matrix(
+            (ratings, (rows, cols)), shape=(len(user_ids), len(movie_ids))
+        )
+    return matrix, user_ids, movie_ids
+
+
+def load_movielens_movies(movies_path):
+    """
+    Loads movieId, title and genre_mask from a MovieLens movies file of any size:
+    u.item (100k), movies.dat (1M/10M, "::"-separated) or movies.csv (20M/25M).
+    Genres without a GENRES bit (e.g. IMAX) are ignored.
+    """
+    if not (movies_path.endswith(".dat") or movies_path.endswith(".csv")):
+        return load_movies(movies_path)
+    if not os.path.exists(movies_path):
+        raise FileNotFoundError(
+            f"Could not find {movies_path}. Please ensure the file is in the data folder."
+        )
+    if movies_path.endswith(".dat"):
+        # Titles contain ":", so this small file is read with the python engine
+        movies = pd.read_csv(
+            movies_path,
+            sep="::",
+            header=None,
+            names=["movieId", "title", "genres"],
+            encoding="latin-1",
+            engine="python",
+        )
+    else:
+        movies = pd.read_csv(movies_path)
+
+    flags = (
+        movies["genres"]
+        .str.get_dummies(sep="|")
+        .rename(columns=GENRE_ALIASES)
+        .T.groupby(level=0)
+        .max()
+        .T.reindex(columns=GENRES, fill_value=0)
+        .to_numpy(dtype=np.uint32)
+    )
+    bits = np.arange(len(GENRES), dtype=np.uint32)
+    movies["genre_mask"] = np.bitwise_or.reduce(flags << bits, axis=1)
+    return movies[["movieId", "title", "genre_mask"]]
+
+
+def merge_data(ratings=None, movies=None):
     """
     Merges movies and ratings on movieId.
+    The MovieLens 100k files are loaded for whichever frame is not given.
     """
-    movies = load_movies()
-    ratings = load_ratings()
-    merged = pd.merge(ratings, movies, on="movieId")
+    with profile_stage("merge"):
+        movies = load_movies() if movies is None else movies
+        ratings = load_ratings() if ratings is None else ratings
+        merged = pd.merge(ratings, movies, on="movieId")
     return merged
 
 
+def filter_popular(data, min_ratings=100):
+    """
+    Keeps only the rows of movies (by title) with at least min_ratings ratings.
+    """
+    # Count number of ratings per movie
+    with profile_stage("filter"):
+        ratings_count = data.groupby("title")["rating"].count()
+        popular_movies = ratings_count[ratings_count >= min_ratings].index
+        return data[data["title"].isin(popular_movies)]
+
+
+# pivot_table's groupby/unstack holds a few copies of the dense result at its peak
+PIVOT_TABLE_OVERHEAD = 3
+
+
+def pivot_ratings(data):
+    """
+    Builds the (users x movies) pivot table of ratings from rows with userId,
+    title and rating, averaging repeated ratings like pivot_table does. Ratings
+    are stored in the configured precision (see numeric_config).
+    If pivot_table's intermediate copies would not fit in the memory budget, the
+    pivot is assembled by scattering the ratings into a single preallocated array.
+    """
+    dtype = get_dtype()
+    n_users, n_titles = data["userId"].nunique(), data["title"].nunique()
+    dense_bytes = n_users * n_titles * dtype.itemsize
+    with profile_stage("pivot"):
+        if within_budget(PIVOT_TABLE_OVERHEAD * dense_bytes, "pivot"):
+            # Casting the ratings first keeps pivot_table's copies in the same dtype
+            ratings = data[["userId", "title", "rating"]].astype({"rating": dtype})
+            return ratings.pivot_table(index="userId", columns="title", values="rating")
+
+        # Encode users and titles once, then average repeated ratings per cell
+        user_codes, users = pd.factorize(data["userId"], sort=True)
+        title_codes, titles = pd.factorize(data["title"], sort=True)
+        cells = user_codes.astype(np.int64) * len(titles) + title_codes
+        ratings = pd.Series(data["rating"].to_numpy()).groupby(cells).mean()
+        matrix = np.full((len(users), len(titles)), np.nan, dtype=dtype)
+        matrix.ravel()[ratings.index.to_numpy()] = ratings.to_numpy()
+        return pd.DataFrame(
+            matrix,
+            index=pd.Index(users, name="userId"),
+            columns=pd.Index(titles, name="title"),
+        )
+
+
+def fill_ratings(pivot):
+    """
+    Returns the pivot's ratings with missing values filled with 0, ready for NMF.
+    Normally this is pivot.fillna(0); if that dense copy would not fit in the
+    memory budget, a scipy.sparse CSR matrix holding only the observed ratings
+    is returned instead (NMF accepts either).
+    """
+    with profile_stage("fill"):
+        itemsize = get_dtype().itemsize
+        if within_budget(pivot.shape[0] * pivot.shape[1] * itemsize, "fill"):
+            return pivot.fillna(0)
+
+        return sparse_ratings(pivot)
+
+
+def sparse_ratings(pivot, dtype=None, block_size=1024):
+    """
+    Returns the observed ratings of a (users x movies) pivot with NaN for
+    missing ratings as a scipy.sparse CSR matrix, in dtype (default: the
+    pivot's). The pivot is converted block_size movies at a time, so no dense
+    copy of the whole pivot is made.
+    """
+    from scipy import sparse
+
+    rows, cols, values = [], [], []
+    for start in range(0, pivot.shape[1], block_size):
+        block = pivot.iloc[:, start : start + block_size].to_numpy(dtype=dtype)
+        block_rows, block_cols = np.nonzero(~np.isnan(block))
+        rows.append(block_rows)
+        cols.append(block_cols + start)
+        values.append(block[block_rows, block_cols])
+    if not values:
+        return sparse.csr_matrix(pivot.shape, dtype=dtype)
+    return sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+        shape=pivot.shape,
+    )
+
+
+# Train/test splits are returned as index arrays (positions in the ratings
+# frame), so they can be cached cheaply and applied with ratings.iloc.
+def _rank_within_user(user_ids, sort_key=None):
+    """
+    Zero-based position of each rating among its user's ratings, in file order
+    or ordered by sort_key (ties keep file order), plus each rating's user's
+    total number of ratings.
+    """
+    user_ids = np.asarray(user_ids)
+    n = len(user_ids)
+    if sort_key is None:
+        order = np.argsort(user_ids, kind="stable")
+    else:
+        order = np.lexsort((np.asarray(sort_key), user_ids))
+    sorted_users = user_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_users[1:] != sorted_users[:-1]])
+    sizes = np.diff(np.r_[starts, n])
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - np.repeat(starts, sizes)
+    counts = np.empty(n, dtype=np.int64)
+    counts[order] = np.repeat(sizes, sizes)
+    return rank, counts
+
+
+def kfold_assignments(ratings, n_folds=5, shuffle=False, seed=42):
+    """
+    Assigns every rating to one of n_folds folds and returns the fold number of
+    each row. Without shuffle the folds are consecutive blocks of rows in file
+    order, which reproduces the u1-u5 splits of data/mku.sh on u.data. Fold
+    numbers are stored in the smallest unsigned integer type that holds them.
+    """
+    if n_folds < 1:
+        raise ValueError(f"n_folds must be at least 1, got {n_folds}")
+    n = len(ratings)
+    positions = np.arange(n)
+    if shuffle:
+        positions = np.random.default_rng(seed).permutation(n)
+    return (positions * n_folds // n).astype(np.min_scalar_type(n_folds - 1))
+
+
+def kfold_split(folds, fold):
+    """
+    Returns (train_idx, test_idx) for one fold of a kfold_assignments array.
+    """
+    test = folds == fold
+    return np.flatnonzero(~test), np.flatnonzero(test)
+
+
+def kfold_splits(folds):
+    """
+    Yields (train_idx, test_idx) for each fold of a kfold_assignments array.
+    """
+    for fold in range(int(folds.max()) + 1):
+        yield kfold_split(folds, fold)
+
+
+def leave_n_out_split(ratings, n_test=10, skip=0, max_test=None):
+    """
+    Holds out ratings skip+1 to skip+n_test of every user, in file order, with
+    at most max_test test ratings overall (taken in file order), like
+    data/allbut.pl. n_test=10 gives the ua split of mku.sh and n_test=10,
+    skip=10 the ub split. Returns (train_idx, test_idx).
+    """
+    rank, _ = _rank_within_user(ratings["userId"].to_numpy())
+    test = (rank >= skip) & (rank < skip + n_test)
+    if max_test is not None:
+        test &= np.cumsum(test) <= max_test
+    return np.flatnonzero(~test), np.flatnonzero(test)
+
+
+def temporal_split(ratings, test_fraction=0.2, per_user=False):
+    """
+    Holds out the most recent ratings by timestamp: the latest test_fraction of
+    all ratings, or with per_user=True the latest test_fraction (rounded down)
+    of each user's ratings. Returns (train_idx, test_idx).
+    """
+    timestamps = ratings["timestamp"].to_numpy()
+    if per_user:
+        rank, counts = _rank_within_user(ratings["userId"].to_numpy(), timestamps)
+        test = rank >= counts - np.floor(counts * test_fraction)
+    else:
+        n_test = int(round(len(timestamps) * test_fraction))
+        test = np.zeros(len(timestamps), dtype=bool)
+        test[np.argsort(timestamps, kind="stable")[len(timestamps) - n_test :]] = True
+    return np.flatnonzero(~test), np.flatnonzero(test)
+
+
+def load_split(method="kfold", fold=0, **params):
+    """
+    Returns (train, test) rating frames of u.data for a split method: "kfold"
+    (the given fold), "leave_n_out" or "temporal", with the method's parameters
+    as keyword arguments. Split indices are computed once and cached by the
+    pipeline (see pipeline.py), so later runs only load the index arrays.
+    """
+    from pipeline import run_pipeline
+
+    ratings = run_pipeline("ratings")
+    split = run_pipeline(f"{method}_split", **params)
+    if method == "kfold":
+        if not 0 <= fold <= int(split.max()):
+            raise ValueError(f"fold must be between 0 and {int(split.max())}")
+        train_idx, test_idx = kfold_split(split, fold)
+    else:
+        train_idx, test_idx = split
+    return ratings.iloc[train_idx], ratings.iloc[test_idx]
+
+
 if __name__ == "__main__":
     data = merge_data()
     print("Merged data shape:", data.shape)
@@ -1,31 +1,51 @@
 # dynamic_update.py
 import pandas as pd
+import numpy as np
 import os
+import time
+import warnings
 import joblib
-from data_preprocessing import merge_data, load_movies
+from data_preprocessing import load_movies, filter_popular, pivot_ratings, fill_ratings
+from pipeline import run_pipeline
 from sklearn.decomposition import NMF
+from sklearn.exceptions import ConvergenceWarning
+from memory_monitor import profile_stage
+from numeric_config import blas_threads, get_dtype
+from logger import logger
+
+# Fixed virtual user id under which all dashboard feedback is recorded
+VIRTUAL_USER_ID = 999999
 
 
 def update_dynamic_model(
-    n_components=20, feedback_file="feedback.csv", output_model="dynamic_model.pkl"
+    n_components=20,
+    feedback_file="feedback.csv",
+    output_model="dynamic_model.pkl",
+    warm_start=False,
+    warm_start_max_iter=30,
 ):
     """
     Loads the original merged MovieLens data and appends user feedback as new ratings.
     Then, it creates an updated pivot table, trains an NMF model on the combined data,
     and saves the model and pivot table to a pickle file.
 
+    With warm_start=True, NMF starts from the W/H factors saved in output_model
+    (see warm_start_factors) instead of a random initialization. Since it starts
+    near a solution, the fit is capped at warm_start_max_iter iterations; the
+    coordinate descent solver's relative stopping rule would otherwise keep it
+    running. Convergence telemetry (iterations, reconstruction error, wall time)
+    is logged and saved with the model either way.
+
     Feedback CSV is expected to have columns:
     selected_movie, recommended_movie, similarity_score, user_rating, timestamp
     Each feedback entry is appended as a new rating from a virtual user (userId=999999).
     """
     # Load original merged data (columns: userId, movieId, rating, timestamp, title)
-    merged = merge_data()
+    merged = run_pipeline("merge")
 
     # If feedback exists, load and incorporate it as additional ratings
     if os.path.exists(feedback_file):
         feedback = pd.read_csv(feedback_file)
-        # Use a fixed virtual user id for feedback (could be changed or extended)
-        virtual_user_id = 999999
         # Load movie metadata to map movie titles to movieIds
         movies_df = load_movies()  # columns: movieId, title
         # Merge feedback with movies data on recommended_movie == title
@@ -37,8 +57,8 @@ def update_dynamic_model(
             how="left",
         )
         # Create new rating entries from feedback
-        feedback_entries = feedback_merged[["movieId", "user_rating"]].copy()
-        feedback_entries["userId"] = virtual_user_id
+        feedback_entries = feedback_merged[["movieId", "title", "user_rating"]].copy()
+        feedback_entries["userId"] = VIRTUAL_USER_ID
         feedback_entries["timestamp"] = pd.Timestamp.now()
         # Rename the user_rating column to rating for consistency
         feedback_entries = feedback_entries.rename(columns={"user_rating": "rating"})
@@ -49,23 +69,138 @@ def update_dynamic_model(
 
     # Create an updated pivot table
     # Filter to movies with at least 50 ratings (lower threshold to account for new feedback)
-    ratings_count = merged.groupby("title")["rating"].count()
-    popular_movies = ratings_count[ratings_count >= 50].index
-    filtered_data = merged[merged["title"].isin(popular_movies)]
-    pivot = filtered_data.pivot_table(index="userId", columns="title", values="rating")
-    pivot_filled = pivot.fillna(0)
+    filtered_data = filter_popular(merged, min_ratings=50)
+    pivot = pivot_ratings(filtered_data)
+    pivot_filled = fill_ratings(pivot)
+
+    # Start from the previous factors if requested and available
+    initial_factors = None
+    previous_err = None
+    if warm_start and os.path.exists(output_model):
+        previous_model = joblib.load(output_model)
+        initial_factors = warm_start_factors(previous_model, pivot, n_components)
+        previous_err = previous_model.get("telemetry", {}).get("reconstruction_err")
 
     # Train NMF model on the updated pivot table
-    nmf_model = NMF(n_components=n_components, init="random", random_state=42)
-    W = nmf_model.fit_transform(pivot_filled)
+    start = time.perf_counter()
+    with profile_stage("nmf"), blas_threads():
+        if initial_factors is not None:
+            W_init, H_init = initial_factors
+            nmf_model = NMF(
+                n_components=n_components,
+                init="custom",
+                max_iter=warm_start_max_iter,
+                random_state=42,
+            )
+            with warnings.catch_warnings():
+                # Hitting the iteration cap is expected for a warm start
+                warnings.simplefilter("ignore", ConvergenceWarning)
+                W = nmf_model.fit_transform(pivot_filled, W=W_init, H=H_init)
+        else:
+            nmf_model = NMF(n_components=n_components, init="random", random_state=42)
+            W = nmf_model.fit_transform(pivot_filled)
     H = nmf_model.components_
+    telemetry = {
+        "warm_start": initial_factors is not None,
+        "n_iter": nmf_model.n_iter_,
+        "reconstruction_err": nmf_model.reconstruction_err_,
+        "seconds": time.perf_counter() - start,
+        "previous_reconstruction_err": previous_err,
+    }
+    logger.info(
+        "NMF %s fit: %d iterations, reconstruction error %.4f (previous: %s), %.2fs",
+        "warm-started" if telemetry["warm_start"] else "cold",
+        telemetry["n_iter"],
+        telemetry["reconstruction_err"],
+        f"{previous_err:.4f}" if previous_err is not None else "n/a",
+        telemetry["seconds"],
+    )
 
     # Save the dynamic model data for later use
-    model_data = {"nmf_model": nmf_model, "pivot": pivot, "W": W, "H": H}
+    model_data = {
+        "nmf_model": nmf_model,
+        "pivot": pivot,
+        "W": W,
+        "H": H,
+        "telemetry": telemetry,
+    }
     joblib.dump(model_data, output_model)
     print(f"Dynamic model updated and saved to {output_model}")
     return model_data
 
 
+def warm_start_factors(previous_model, pivot, n_components):
+    """
+    Builds initial (W, H) for fitting NMF on pivot from a previously saved model.
+    Users and movies present in the previous pivot keep their saved factors;
+    new users and movies start from the mean of the saved user/movie factors.
+    Returns None if the previous model has a different number of components.
+    The factors are cast to the configured precision, which NMF requires to
+    match the ratings' dtype.
+    """
+    prev_W, prev_H = previous_model["W"], previous_model["H"]
+    if prev_H.shape[0] != n_components:
+        return None
+    prev_pivot = previous_model["pivot"]
+
+    user_pos = prev_pivot.index.get_indexer(pivot.index)
+    W = np.where((user_pos >= 0)[:, None], prev_W[user_pos], prev_W.mean(axis=0))
+    movie_pos = prev_pivot.columns.get_indexer(pivot.columns)
+    H = np.where(movie_pos >= 0, prev_H[:, movie_pos], prev_H.mean(axis=1)[:, None])
+    logger.info(
+        "Warm start: reusing factors for %d/%d users and %d/%d movies",
+        (user_pos >= 0).sum(),
+        len(user_pos),
+        (movie_pos >= 0).sum(),
+        len(movie_pos),
+    )
+    dtype = get_dtype()
+    return W.astype(dtype, copy=False), H.astype(dtype, copy=False)
+
+
+def incremental_update(
+    user_ratings, user_id=VIRTUAL_USER_ID, output_model="dynamic_model.pkl"
+):
+    """
+    Folds a single user's latest ratings into a previously saved dynamic model
+    without refitting NMF. The movie factors (H) are kept fixed; only the pivot
+    row and the latent factors (W row) of the given user are recomputed.
+
+    user_ratings is a Series indexed by movie title holding the user's current
+    (mean) rating for each title. Titles outside the model's pivot are ignored.
+    Returns the updated model data, or None if no saved model exists yet.
+    """
+    if not os.path.exists(output_model):
+        return None
+    model_data = joblib.load(output_model)
+    pivot = model_data["pivot"]
+    nmf_model = model_data["nmf_model"]
+
+    known = user_ratings[user_ratings.index.isin(pivot.columns)]
+    if known.empty:
+        return model_data
+
+    # Keep the pivot in the precision it was built with
+    dtype = pivot.dtypes.iloc[0]
+    if user_id not in pivot.index:
+        pivot.loc[user_id] = pd.Series(np.nan, index=pivot.columns, dtype=dtype)
+    pivot.loc[user_id, known.index] = known.to_numpy(dtype=dtype)
+
+    # Project the updated user row onto the existing movie factors, in the
+    # dtype the model was fitted with
+    W = model_data["W"]
+    user_row = pivot.loc[[user_id]].fillna(0).astype(W.dtype)
+    w_row = nmf_model.transform(user_row)
+    row_pos = pivot.index.get_loc(user_id)
+    if row_pos < W.shape[0]:
+        W[row_pos] = w_row[0]
+    else:
+        W = np.vstack([W, w_row])
+
+    model_data.update({"pivot": pivot, "W": W})
+    joblib.dump(model_data, output_model)
+    return model_data
+
+
 if __name__ == "__main__":
     update_dynamic_model()
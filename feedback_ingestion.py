@@ -0,0 +1,368 @@
+# feedback_ingestion.py
+import datetime
+import io
+import os
+import threading
+import time
+from collections import deque
+import pandas as pd
+from dynamic_update import update_dynamic_model, incremental_update, VIRTUAL_USER_ID
+from logger import logger
+
+FEEDBACK_COLUMNS = [
+    "selected_movie",
+    "recommended_movie",
+    "similarity_score",
+    "user_rating",
+    "timestamp",
+]
+
+# Serializes appends from concurrent dashboard sessions within a process
+_append_lock = threading.Lock()
+
+
+def append_feedback(feedback, feedback_file="feedback.csv"):
+    """
+    Appends feedback entries (dicts with the FEEDBACK_COLUMNS keys) to the
+    feedback CSV, writing the header if the file does not exist yet.
+    """
+    df_feedback = pd.DataFrame(feedback, columns=FEEDBACK_COLUMNS)
+    with _append_lock:
+        header_needed = not os.path.exists(feedback_file)
+        df_feedback.to_csv(
+            feedback_file,
+            mode="a",
+            header=header_needed,
+            index=False,
+        )
+
+
+def read_feedback_since(feedback_file, offset=0):
+    """
+    Reads the complete feedback rows appended after byte offset.
+    Returns the new rows and the offset just past the last complete line; a
+    trailing partial line is left for the next call.
+    """
+    with open(feedback_file, "rb") as f:
+        f.seek(offset)
+        chunk = f.read()
+    end = chunk.rfind(b"\n")
+    if end == -1:
+        return pd.DataFrame(columns=FEEDBACK_COLUMNS), offset
+    chunk = chunk[: end + 1]
+    from_start = offset == 0
+
+    new_rows = pd.read_csv(
+        io.BytesIO(chunk),
+        header=0 if from_start else None,
+        names=None if from_start else FEEDBACK_COLUMNS,
+    )
+    new_rows = new_rows.dropna(subset=["recommended_movie", "user_rating"])
+    return new_rows, offset + len(chunk)
+
+
+def event_time(event, default=None):
+    """
+    Returns when a feedback event was written (its ISO timestamp, local time)
+    as seconds since the epoch, or default if the timestamp is missing or invalid.
+    """
+    try:
+        return datetime.datetime.fromisoformat(str(event["timestamp"])).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return default
+
+
+class FeedbackIngestionWorker:
+    """
+    Background worker that tails the feedback CSV written by the dashboard,
+    groups new feedback events into micro-batches and keeps the dynamic model
+    up to date.
+
+    Each flushed batch updates the running per-user and per-item statistics.
+    Small volumes are folded into the saved model with an incremental update
+    (the feedback user's latent factors are re-projected onto the existing
+    movie factors); once enough events have accumulated, or enough time has
+    passed since the last refit, the model is fully retrained with
+    update_dynamic_model.
+
+    Feedback already in the file when the worker starts is replayed into the
+    statistics and folded into the model once, without counting towards the
+    refit volume; only lines appended afterwards are queued as new events.
+    """
+
+    def __init__(
+        self,
+        feedback_file="feedback.csv",
+        output_model="dynamic_model.pkl",
+        n_components=20,
+        batch_size=50,
+        max_batch_delay=5.0,
+        refit_min_events=500,
+        refit_interval=3600.0,
+        poll_interval=1.0,
+    ):
+        self.feedback_file = feedback_file
+        self.output_model = output_model
+        self.n_components = n_components
+        self.batch_size = batch_size
+        self.max_batch_delay = max_batch_delay
+        self.refit_min_events = refit_min_events
+        self.refit_interval = refit_interval
+        self.poll_interval = poll_interval
+
+        # Tail state: byte offset of the first unread line in the feedback file
+        self._offset = 0
+        self._history_replayed = False
+        self._pending = deque()  # (arrival_time, event_time, event_dict)
+
+        # Running statistics: {key: [count, rating_sum]}
+        self.user_stats = {}
+        self.item_stats = {}
+
+        self._events_since_refit = 0
+        self._last_refit = time.monotonic()
+        self._started_at = time.time()
+
+        self._metrics = {
+            "events_ingested": 0,
+            "events_processed": 0,
+            "batches_processed": 0,
+            "incremental_updates": 0,
+            "full_refits": 0,
+            "last_batch_size": 0,
+            "last_batch_seconds": 0.0,
+        }
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # ------------------------------
+    # Tailing
+    # ------------------------------
+    def _replay_history(self):
+        """
+        Folds the feedback already in the file into the running statistics and
+        applies it to the saved model with one incremental update. Replayed
+        events are not queued and do not count towards a full refit.
+        """
+        self._history_replayed = True
+        history, self._offset = read_feedback_since(self.feedback_file, 0)
+        if history.empty:
+            return
+        affected_items = self._update_statistics(history.to_dict("records"))
+        logger.info("Replayed %d existing feedback events.", len(history))
+        if os.path.exists(self.output_model):
+            self._incremental_update(affected_items)
+
+    def poll(self):
+        """
+        Reads any complete lines appended to the feedback file since the last
+        poll and queues them as pending events. Returns the number of new events.
+        """
+        if not os.path.exists(self.feedback_file):
+            return 0
+        if not self._history_replayed:
+            self._replay_history()
+        size = os.path.getsize(self.feedback_file)
+        if size < self._offset:
+            # File was truncated or replaced; start over from the beginning
+            logger.warning("Feedback file shrank; re-reading from the start.")
+            self._offset = 0
+        if size == self._offset:
+            return 0
+        new_rows, self._offset = read_feedback_since(self.feedback_file, self._offset)
+        arrival = time.time()
+        with self._lock:
+            for event in new_rows.to_dict("records"):
+                self._pending.append((arrival, event_time(event, arrival), event))
+            self._metrics["events_ingested"] += len(new_rows)
+        return len(new_rows)
+
+    # ------------------------------
+    # Micro-batching
+    # ------------------------------
+    def _batch_ready(self):
+        if not self._pending:
+            return False
+        if len(self._pending) >= self.batch_size:
+            return True
+        oldest_arrival = self._pending[0][0]
+        return time.time() - oldest_arrival >= self.max_batch_delay
+
+    def flush(self, force=False):
+        """
+        Processes one micro-batch of pending events if the size or delay
+        threshold has been reached (or unconditionally when force=True).
+        Returns the number of events processed.
+        """
+        with self._lock:
+            if not (force and self._pending) and not self._batch_ready():
+                return 0
+            count = min(len(self._pending), self.batch_size)
+            batch = [self._pending.popleft()[2] for _ in range(count)]
+
+        start = time.perf_counter()
+        affected_items = self._update_statistics(batch)
+        self._events_since_refit += len(batch)
+
+        if self._refit_due():
+            self._full_refit()
+        else:
+            self._incremental_update(affected_items)
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._metrics["events_processed"] += len(batch)
+            self._metrics["batches_processed"] += 1
+            self._metrics["last_batch_size"] = len(batch)
+            self._metrics["last_batch_seconds"] = elapsed
+        logger.info(
+            "Processed feedback batch of %d events in %.2fs", len(batch), elapsed
+        )
+        return len(batch)
+
+    def _update_statistics(self, batch):
+        affected_items = set()
+        for event in batch:
+            rating = float(event["user_rating"])
+            title = event["recommended_movie"]
+            for stats, key in (
+                (self.user_stats, VIRTUAL_USER_ID),
+                (self.item_stats, title),
+            ):
+                entry = stats.setdefault(key, [0, 0.0])
+                entry[0] += 1
+                entry[1] += rating
+            affected_items.add(title)
+        return affected_items
+
+    def _refit_due(self):
+        if self._events_since_refit >= self.refit_min_events:
+            return True
+        return time.monotonic() - self._last_refit >= self.refit_interval
+
+    def _full_refit(self):
+        logger.info(
+            "Running full refit after %d new feedback events.",
+            self._events_since_refit,
+        )
+        update_dynamic_model(
+            n_components=self.n_components,
+            feedback_file=self.feedback_file,
+            output_model=self.output_model,
+            warm_start=True,
+        )
+        self._events_since_refit = 0
+        self._last_refit = time.monotonic()
+        with self._lock:
+            self._metrics["full_refits"] += 1
+
+    def _incremental_update(self, affected_items):
+        # The feedback user's pivot value for a title is the mean of all its
+        # feedback on that title, matching what pivot_table does on a refit.
+        user_ratings = pd.Series(
+            {
+                title: self.item_stats[title][1] / self.item_stats[title][0]
+                for title in affected_items
+            },
+            dtype=float,
+        )
+        model_data = incremental_update(
+            user_ratings, user_id=VIRTUAL_USER_ID, output_model=self.output_model
+        )
+        if model_data is None:
+            # No saved model yet; bootstrap one with a full fit
+            self._full_refit()
+            return
+        with self._lock:
+            self._metrics["incremental_updates"] += 1
+
+    # ------------------------------
+    # Metrics
+    # ------------------------------
+    def metrics(self):
+        """
+        Returns a snapshot of ingestion metrics, including queue depth, queue lag
+        (seconds since the oldest pending event was written to the feedback file)
+        and throughput in events/sec.
+        """
+        now = time.time()
+        with self._lock:
+            snapshot = dict(self._metrics)
+            snapshot["queue_depth"] = len(self._pending)
+            snapshot["queue_lag_seconds"] = (
+                now - self._pending[0][1] if self._pending else 0.0
+            )
+        running_for = now - self._started_at
+        snapshot["uptime_seconds"] = running_for
+        snapshot["events_per_second"] = (
+            snapshot["events_processed"] / running_for if running_for > 0 else 0.0
+        )
+        snapshot["events_since_refit"] = self._events_since_refit
+        return snapshot
+
+    # ------------------------------
+    # Thread lifecycle
+    # ------------------------------
+    def run_once(self):
+        """
+        Performs one poll and drains every batch that is ready.
+        """
+        self.poll()
+        while self.flush():
+            pass
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("Feedback ingestion error: %s", e)
+            self._stop_event.wait(self.poll_interval)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._started_at = time.time()
+        self._thread = threading.Thread(
+            target=self._run, name="feedback-ingestion", daemon=True
+        )
+        self._thread.start()
+        logger.info("Feedback ingestion worker started on %s", self.feedback_file)
+
+    def stop(self, drain=True):
+        """
+        Stops the background thread. With drain=True any remaining pending
+        events are processed before returning.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if drain:
+            self.poll()
+            while self.flush(force=True):
+                pass
+        logger.info("Feedback ingestion worker stopped.")
+
+
+if __name__ == "__main__":
+    worker = FeedbackIngestionWorker()
+    worker.start()
+    try:
+        while True:
+            time.sleep(10)
+            m = worker.metrics()
+            logger.info(
+                "Ingestion: depth=%d lag=%.1fs throughput=%.2f ev/s "
+                "batches=%d incremental=%d refits=%d",
+                m["queue_depth"],
+                m["queue_lag_seconds"],
+                m["events_per_second"],
+                m["batches_processed"],
+                m["incremental_updates"],
+                m["full_refits"],
+            )
+    except KeyboardInterrupt:
+        worker.stop()
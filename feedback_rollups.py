@@ -0,0 +1,96 @@
+# feedback_rollups.py
+import os
+import joblib
+import pandas as pd
+from feedback_ingestion import read_feedback_since
+from pipeline import dump_atomic
+from logger import logger
+
+
+def empty_rollups():
+    """
+    Returns rollups covering no feedback yet.
+    """
+    return {
+        "offset": 0,  # high-water mark: bytes of feedback.csv already aggregated
+        "rows": 0,
+        "movie_stats": pd.DataFrame(
+            {"rating_sum": pd.Series(dtype=float), "rating_count": pd.Series(dtype=int)}
+        ),
+        "daily_counts": pd.Series(dtype=int),
+    }
+
+
+def update_feedback_rollups(
+    feedback_file="feedback.csv", rollup_file="feedback_rollups.pkl"
+):
+    """
+    Brings the feedback rollups up to date and returns them.
+
+    The rollups hold per-movie rating sums and counts and per-day feedback counts,
+    together with the byte offset in feedback_file they have been computed up to.
+    Only rows appended after that high-water mark are read and aggregated, so the
+    cost of an update is proportional to the new feedback. If the feedback file is
+    shorter than the high-water mark (truncated or replaced), the rollups are
+    rebuilt from scratch.
+    """
+    rollups = joblib.load(rollup_file) if os.path.exists(rollup_file) else None
+    if not os.path.exists(feedback_file):
+        return rollups or empty_rollups()
+
+    size = os.path.getsize(feedback_file)
+    if rollups is None or size < rollups["offset"]:
+        rollups = empty_rollups()
+    if size == rollups["offset"]:
+        return rollups
+
+    new_rows, offset = read_feedback_since(feedback_file, rollups["offset"])
+    if offset == rollups["offset"]:
+        return rollups
+
+    new_movie_stats = new_rows.groupby("recommended_movie")["user_rating"].agg(
+        rating_sum="sum", rating_count="count"
+    )
+    dates = pd.to_datetime(new_rows["timestamp"], format="ISO8601").dt.date
+    new_daily_counts = dates.value_counts()
+
+    rollups["movie_stats"] = (
+        rollups["movie_stats"]
+        .add(new_movie_stats, fill_value=0)
+        .astype({"rating_count": int})
+    )
+    rollups["daily_counts"] = (
+        rollups["daily_counts"].add(new_daily_counts, fill_value=0).astype(int)
+    )
+    rollups["offset"] = offset
+    rollups["rows"] += len(new_rows)
+    dump_atomic(rollups, rollup_file)
+    logger.info(
+        "Feedback rollups updated with %d new rows (%d total).",
+        len(new_rows),
+        rollups["rows"],
+    )
+    return rollups
+
+
+def average_ratings(rollups):
+    """
+    Returns a DataFrame of recommended_movie and its average user_rating.
+    """
+    movie_stats = rollups["movie_stats"]
+    avg = movie_stats["rating_sum"] / movie_stats["rating_count"]
+    return avg.rename("user_rating").rename_axis("recommended_movie").reset_index()
+
+
+def daily_feedback_counts(rollups):
+    """
+    Returns a DataFrame of date and the number of feedback entries on that date.
+    """
+    daily = rollups["daily_counts"].sort_index()
+    return daily.rename("count").rename_axis("date").reset_index()
+
+
+if __name__ == "__main__":
+    rollups = update_feedback_rollups()
+    print(average_ratings(rollups))
+    print(daily_feedback_counts(rollups))
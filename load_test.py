@@ -0,0 +1,243 @@
+# load_test.py
+import argparse
+import datetime
+import json
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from logger import logger
+
+OPERATIONS = ["lookup", "recommend", "feedback"]
+
+
+class InProcessTarget:
+    """
+    Runs the same calls the dashboard makes directly against the engines:
+    fuzzy title lookup, recommendations from a trained model snapshot (as
+    served by model_manager), and feedback appends to feedback_file.
+    """
+
+    def __init__(self, engine="advanced", feedback_file="loadtest_feedback.csv"):
+        from model_manager import ModelManager
+        from recommendation_engine import get_recommendations
+
+        self.engine = engine
+        self.feedback_file = feedback_file
+        # Train up front so only the request path is measured
+        manager = ModelManager()
+        manager.retrain()
+        manager.wait()
+        snapshot = manager.snapshot()
+        if snapshot is None:
+            raise RuntimeError(
+                f"Model training failed: {manager.status()['last_error']}"
+            )
+        self.pivot = snapshot.pivot
+        self.titles = list(self.pivot.columns)
+        similarity = (
+            snapshot.correlation if engine == "traditional" else snapshot.similarity
+        )
+        self._recommend = lambda title: get_recommendations(
+            title, snapshot.pivot, similarity
+        )
+
+    def lookup(self, query):
+        from thefuzz import process
+
+        match, score = process.extractOne(query, self.titles)
+        return match if score >= 70 else None
+
+    def recommend(self, title):
+        return list(self._recommend(title).items())
+
+    def feedback(self, entries):
+        from feedback_ingestion import append_feedback
+
+        append_feedback(entries, self.feedback_file)
+
+
+class HttpTarget:
+    """
+    Sends the same request mix to a local HTTP endpoint:
+        GET  {base_url}/lookup?query=...           -> {"title": ...}
+        GET  {base_url}/recommendations?movie=...  -> [[title, score], ...]
+        POST {base_url}/feedback  (JSON list of feedback entries)
+    """
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, params=None, payload=None):
+        url = f"{self.base_url}{path}"
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        data = None
+        headers = {}
+        if payload is not None:
+            data = json.dumps(payload).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        request = urllib.request.Request(url, data=data, headers=headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            body = response.read()
+        return json.loads(body) if body else None
+
+    def lookup(self, query):
+        return self._request("/lookup", {"query": query})["title"]
+
+    def recommend(self, title):
+        return self._request("/recommendations", {"movie": title})
+
+    def feedback(self, entries):
+        self._request("/feedback", payload=entries)
+
+
+class LoadTest:
+    """
+    Simulates concurrent dashboard sessions against a target and records the
+    latency of every operation.
+
+    Each simulated session picks a movie (weighted by its number of ratings),
+    looks it up by a partial title, requests recommendations for the match and,
+    with probability feedback_rate, rates them as the dashboard's feedback form
+    does.
+    """
+
+    def __init__(self, target, titles, weights=None, feedback_rate=0.3, seed=42):
+        self.target = target
+        self.titles = list(titles)
+        self.weights = (
+            None if weights is None else np.asarray(weights) / np.sum(weights)
+        )
+        self.feedback_rate = feedback_rate
+        self.seed = seed
+        self._samples = []  # (operation, seconds, ok)
+        self._lock = threading.Lock()
+
+    def _timed(self, operation, func, *args):
+        start = time.perf_counter()
+        ok = True
+        try:
+            return func(*args)
+        except Exception as e:
+            ok = False
+            logger.debug("Load test %s failed: %s", operation, e)
+        finally:
+            with self._lock:
+                self._samples.append((operation, time.perf_counter() - start, ok))
+
+    def _session(self, rng):
+        title = self.titles[rng.choice(len(self.titles), p=self.weights)]
+        # Users tend to type the start of a title
+        query = title[: max(4, int(len(title) * rng.uniform(0.4, 1.0)))]
+        match = self._timed("lookup", self.target.lookup, query)
+        if match is None:
+            return
+        recommendations = self._timed("recommend", self.target.recommend, match)
+        if not recommendations or rng.random() >= self.feedback_rate:
+            return
+        entries = [
+            {
+                "selected_movie": match,
+                "recommended_movie": rec_title,
+                "similarity_score": score,
+                "user_rating": int(rng.integers(1, 6)),
+                "timestamp": datetime.datetime.now().isoformat(),
+            }
+            for rec_title, score in recommendations
+        ]
+        self._timed("feedback", self.target.feedback, entries)
+
+    def _user(self, user_index, deadline, sessions):
+        rng = np.random.default_rng(self.seed + user_index)
+        done = 0
+        while time.perf_counter() < deadline and (sessions is None or done < sessions):
+            self._session(rng)
+            done += 1
+
+    def run(self, concurrency=8, duration=30.0, sessions_per_user=None):
+        """
+        Runs concurrency simulated users until duration seconds have passed or
+        each user has completed sessions_per_user sessions. Returns the report.
+        """
+        self._samples = []
+        start = time.perf_counter()
+        deadline = start + duration
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for user_index in range(concurrency):
+                executor.submit(self._user, user_index, deadline, sessions_per_user)
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed):
+        """
+        Summarizes throughput and p50/p95/p99 latency (ms) of successful calls
+        per operation, along with the number of failed calls.
+        """
+        samples = pd.DataFrame(self._samples, columns=["operation", "seconds", "ok"])
+        rows = []
+        for operation in OPERATIONS:
+            calls = samples[samples["operation"] == operation]
+            if calls.empty:
+                continue
+            latencies_ms = calls.loc[calls["ok"], "seconds"] * 1000
+            p50, p95, p99 = (
+                np.percentile(latencies_ms, [50, 95, 99])
+                if not latencies_ms.empty
+                else (np.nan, np.nan, np.nan)
+            )
+            rows.append(
+                {
+                    "operation": operation,
+                    "count": len(calls),
+                    "errors": int((~calls["ok"]).sum()),
+                    "throughput_per_s": len(latencies_ms) / elapsed,
+                    "p50_ms": p50,
+                    "p95_ms": p95,
+                    "p99_ms": p99,
+                }
+            )
+        return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simulate concurrent dashboard users and report tail latency."
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--sessions", type=int, default=None, help="per user")
+    parser.add_argument("--feedback-rate", type=float, default=0.3)
+    parser.add_argument(
+        "--engine", choices=["advanced", "traditional"], default="advanced"
+    )
+    parser.add_argument("--feedback-file", default="loadtest_feedback.csv")
+    parser.add_argument(
+        "--url", default=None, help="local endpoint to test instead of in-process"
+    )
+    args = parser.parse_args()
+
+    from pipeline import run_pipeline
+
+    # Movies are requested in proportion to how often they were rated. The
+    # cached pivot is enough for that; a model is only trained when testing
+    # in-process.
+    pivot = run_pipeline("pivot")
+    titles = list(pivot.columns)
+    weights = pivot.notna().sum().to_numpy()
+    if args.url:
+        target = HttpTarget(args.url)
+    else:
+        target = InProcessTarget(args.engine, args.feedback_file)
+
+    load_test = LoadTest(target, titles, weights, feedback_rate=args.feedback_rate)
+    logger.info(
+        "Running load test with %d concurrent users for %.0fs...",
+        args.concurrency,
+        args.duration,
+    )
+    report = load_test.run(args.concurrency, args.duration, args.sessions)
+    print(report.to_string(index=False, float_format="%.2f"))
@@ -1,7 +1,6 @@
 import sys
 import os
 import datetime
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -14,9 +13,16 @@ from advanced_recommender import create_pivot_table, advanced_recommendations
 from recommendation_engine import (
     create_pivot_table as create_pivot_table_traditional,
     get_recommendations,
-    compute_similarity,
 )
-from data_preprocessing import merge_data, load_movies
+from data_preprocessing import merge_data, load_movies, GENRES
+from feedback_ingestion import append_feedback
+from pipeline import run_pipeline
+from model_manager import get_model_manager
+from feedback_rollups import (
+    update_feedback_rollups,
+    average_ratings,
+    daily_feedback_counts,
+)
 from logger import logger
 
 
@@ -93,29 +99,53 @@ def run_streamlit_app():
     # Option to toggle debug output (if needed)
     debug_mode = st.checkbox("Enable Debug Output", value=False)
 
-    @st.cache_resource
-    def get_pivot_advanced_streamlit():
-        return get_pivot_advanced_global()
+    # Models are trained once per process in the background and shared read-only
+    def show_model_status(manager):
+        status = manager.status()
+        st.sidebar.header("Model Status")
+        if status["state"] == "training":
+            st.sidebar.info("Training in the background...")
+        elif status["state"] == "failed":
+            st.sidebar.error(f"Last training failed: {status['last_error']}")
+        if status["version"] is not None:
+            trained_at = datetime.datetime.fromtimestamp(status["trained_at"])
+            st.sidebar.write(
+                f"Serving model v{status['version']} "
+                f"(trained {trained_at:%Y-%m-%d %H:%M:%S} "
+                f"in {status['duration']:.1f}s)"
+            )
+        if st.sidebar.button("Retrain models"):
+            manager.retrain()
+        st.sidebar.button("Refresh status")
 
-    @st.cache_resource
-    def get_pivot_traditional_streamlit():
-        return get_pivot_traditional_global()
+    manager = get_model_manager()
+    manager.ensure_started()
+    show_model_status(manager)
+    snapshot = manager.snapshot()
 
     tabs = st.tabs(["Recommendations", "Feedback Trends", "A/B Testing"])
 
     # Tab 1: Advanced Recommendations with Feedback
     with tabs[0]:
         st.header("Advanced Recommendations")
-        pivot = get_pivot_advanced_streamlit()
-        movie_list = list(pivot.columns)
-        movie_list.sort()
+        if snapshot is None:
+            st.info("Models are training in the background; please check back shortly.")
+        movie_list = snapshot.movie_titles if snapshot else []
         selected_movie = st.selectbox("Choose a movie", movie_list)
-        if st.button("Get Advanced Recommendations", key="advanced"):
+        include_genres = st.multiselect("Only include genres", GENRES)
+        exclude_genres = st.multiselect("Exclude genres", GENRES)
+        if snapshot and st.button("Get Advanced Recommendations", key="advanced"):
             try:
                 logger.info(
                     "Generating advanced recommendations for: %s", selected_movie
                 )
-                recommendations = advanced_recommendations(selected_movie, pivot)
+                recommendations = get_recommendations(
+                    selected_movie,
+                    snapshot.pivot,
+                    snapshot.similarity,
+                    include_genres=include_genres,
+                    exclude_genres=exclude_genres,
+                )
                 st.write(f"Movies similar to **{selected_movie}**:")
                 rec_df = recommendations.reset_index().rename(
                     columns={selected_movie: "Similarity Score"}
@@ -148,14 +178,7 @@ def run_streamlit_app():
                         feedback_file = os.path.join(os.getcwd(), "feedback.csv")
                         logger.info("Saving feedback to: %s", feedback_file)
                         try:
-                            df_feedback = pd.DataFrame(feedback)
-                            header_needed = not os.path.exists(feedback_file)
-                            df_feedback.to_csv(
-                                feedback_file,
-                                mode="a",
-                                header=header_needed,
-                                index=False,
-                            )
+                            append_feedback(feedback, feedback_file)
                             st.success(
                                 f"Feedback submitted successfully! Saved to {feedback_file}"
                             )
@@ -172,13 +195,9 @@ def run_streamlit_app():
     # Tab 2: Feedback Trends
     def plot_feedback_trends(feedback_file="feedback.csv"):
         if os.path.exists(feedback_file):
-            feedback = pd.read_csv(feedback_file)
+            rollups = update_feedback_rollups(feedback_file)
             st.subheader("Average Rating per Recommended Movie")
-            avg_ratings = (
-                feedback.groupby("recommended_movie")["user_rating"]
-                .mean()
-                .reset_index()
-            )
+            avg_ratings = average_ratings(rollups)
             fig, ax = plt.subplots(figsize=(10, 6))
             sns.barplot(
                 x="recommended_movie",
@@ -193,9 +212,7 @@ def run_streamlit_app():
             st.pyplot(fig)
 
             st.subheader("Feedback Count Over Time")
-            feedback["timestamp"] = pd.to_datetime(feedback["timestamp"])
-            feedback["date"] = feedback["timestamp"].dt.date
-            daily_counts = feedback.groupby("date").size().reset_index(name="count")
+            daily_counts = daily_feedback_counts(rollups)
             fig2, ax2 = plt.subplots(figsize=(10, 6))
             sns.lineplot(x="date", y="count", data=daily_counts, marker="o", ax=ax2)
             ax2.set_ylabel("Feedback Count")
@@ -211,36 +228,39 @@ def run_streamlit_app():
     # Tab 3: A/B Testing (Traditional vs Advanced)
     with tabs[2]:
         st.header("A/B Testing: Traditional vs Advanced Recommendations")
-        pivot_trad = get_pivot_traditional_streamlit()
-        movie_list_trad = list(pivot_trad.columns)
-        movie_list_trad.sort()
-        selected_movie_ab = st.selectbox(
-            "Choose a movie for A/B testing", movie_list_trad, key="ab"
-        )
-        col1, col2 = st.columns(2)
-        with col1:
-            st.subheader("Traditional Recommendations")
-            try:
-                corr_matrix = compute_similarity(pivot_trad)
-                trad_recs = get_recommendations(
-                    selected_movie_ab, pivot_trad, corr_matrix
-                )
-                trad_df = trad_recs.reset_index().rename(
-                    columns={selected_movie_ab: "Correlation"}
-                )
-                st.table(trad_df)
-            except Exception as e:
-                st.error(f"Error (Traditional): {e}")
-        with col2:
-            st.subheader("Advanced Recommendations")
-            try:
-                adv_recs = advanced_recommendations(selected_movie_ab, pivot_trad)
-                adv_df = adv_recs.reset_index().rename(
-                    columns={selected_movie_ab: "Similarity Score"}
-                )
-                st.table(adv_df)
-            except Exception as e:
-                st.error(f"Error (Advanced): {e}")
+        if snapshot is None:
+            # The selectbox is only created once there are titles to choose
+            # from; created empty, its keyed value would stay None afterwards.
+            st.info("Models are training in the background; please check back shortly.")
+        else:
+            selected_movie_ab = st.selectbox(
+                "Choose a movie for A/B testing", snapshot.movie_titles, key="ab"
+            )
+            col1, col2 = st.columns(2)
+            with col1:
+                st.subheader("Traditional Recommendations")
+                try:
+                    trad_recs = get_recommendations(
+                        selected_movie_ab, snapshot.pivot, snapshot.correlation
+                    )
+                    trad_df = trad_recs.reset_index().rename(
+                        columns={selected_movie_ab: "Correlation"}
+                    )
+                    st.table(trad_df)
+                except Exception as e:
+                    st.error(f"Error (Traditional): {e}")
+            with col2:
+                st.subheader("Advanced Recommendations")
+                try:
+                    adv_recs = get_recommendations(
+                        selected_movie_ab, snapshot.pivot, snapshot.similarity
+                    )
+                    adv_df = adv_recs.reset_index().rename(
+                        columns={selected_movie_ab: "Similarity Score"}
+                    )
+                    st.table(adv_df)
+                except Exception as e:
+                    st.error(f"Error (Advanced): {e}")
 
     st.markdown("---")
     st.write("When you're done, click the button below to exit the dashboard.")
@@ -362,7 +382,7 @@ def terminal_recommendation(console):
         )
     )
     pivot = create_pivot_table_traditional()
-    corr_matrix = compute_similarity(pivot)
+    corr_matrix = run_pipeline("correlation")
     movie_list = list(pivot.columns)
     console.print(
         "\nEnter a movie title for recommendations (partial titles accepted):"
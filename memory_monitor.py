@@ -0,0 +1,161 @@
+# memory_monitor.py
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+from logger import logger
+
+try:
+    import psutil
+except ImportError:  # psutil is optional; fall back to /proc on Linux
+    psutil = None
+
+# Memory budget in bytes (None = unlimited). Can be set with the
+# MOVIE_REC_MEMORY_BUDGET_MB environment variable or set_memory_budget().
+_budget_bytes = (
+    int(float(os.environ["MOVIE_REC_MEMORY_BUDGET_MB"]) * 1024**2)
+    if os.environ.get("MOVIE_REC_MEMORY_BUDGET_MB")
+    else None
+)
+# Per-stage profiling is opt-in because tracemalloc slows down allocations
+_profiling = os.environ.get("MOVIE_REC_PROFILE_MEMORY") == "1"
+_stage_reports = []
+
+
+def set_memory_budget(megabytes):
+    """
+    Sets the memory budget in megabytes; None removes the budget.
+    """
+    global _budget_bytes
+    _budget_bytes = None if megabytes is None else int(megabytes * 1024**2)
+
+
+def get_memory_budget():
+    """
+    Returns the memory budget in bytes, or None if unlimited.
+    """
+    return _budget_bytes
+
+
+def enable_profiling(enabled=True):
+    """
+    Turns per-stage memory profiling on or off.
+    """
+    global _profiling
+    _profiling = enabled
+
+
+def current_rss():
+    """
+    Returns the resident set size of this process in bytes, or None if unavailable.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def within_budget(required_bytes, stage):
+    """
+    Returns True if a stage that needs required_bytes of additional memory fits
+    in the budget given the current RSS. Logs a warning when it does not, so the
+    caller can switch to its chunked or sparse code path.
+    """
+    if _budget_bytes is None:
+        return True
+    in_use = current_rss() or 0
+    if in_use + required_bytes <= _budget_bytes:
+        return True
+    logger.warning(
+        "Stage '%s' needs ~%.1f MB with %.1f MB in use, over the %.1f MB budget; "
+        "using the memory-saving code path.",
+        stage,
+        required_bytes / 1024**2,
+        in_use / 1024**2,
+        _budget_bytes / 1024**2,
+    )
+    return False
+
+
+@contextmanager
+def profile_stage(name):
+    """
+    Records traced allocations (current and peak, via tracemalloc), RSS and wall
+    time for the enclosed pipeline stage when profiling is enabled.
+    """
+    if not _profiling:
+        yield
+        return
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    traced_before, _ = tracemalloc.get_traced_memory()
+    rss_before = current_rss()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        traced_after, traced_peak = tracemalloc.get_traced_memory()
+        rss_after = current_rss()
+        if started_tracing:
+            tracemalloc.stop()
+        report = {
+            "stage": name,
+            "seconds": time.perf_counter() - start,
+            "retained_mb": (traced_after - traced_before) / 1024**2,
+            "peak_mb": (traced_peak - traced_before) / 1024**2,
+            "rss_mb": rss_after / 1024**2 if rss_after is not None else None,
+            "rss_delta_mb": (
+                (rss_after - rss_before) / 1024**2
+                if rss_after is not None and rss_before is not None
+                else None
+            ),
+        }
+        _stage_reports.append(report)
+        logger.debug(
+            "Stage '%s': peak %.1f MB, retained %.1f MB, %.2fs",
+            name,
+            report["peak_mb"],
+            report["retained_mb"],
+            report["seconds"],
+        )
+
+
+def stage_report(reset=False):
+    """
+    Returns the recorded per-stage memory measurements as a DataFrame.
+    """
+    report = pd.DataFrame(
+        _stage_reports,
+        columns=[
+            "stage",
+            "seconds",
+            "retained_mb",
+            "peak_mb",
+            "rss_mb",
+            "rss_delta_mb",
+        ],
+    )
+    if reset:
+        _stage_reports.clear()
+    return report
+
+
+if __name__ == "__main__":
+    # The pipeline modules record into the imported memory_monitor module,
+    # not into this __main__ copy of it.
+    import memory_monitor
+    from advanced_recommender import create_pivot_table, advanced_recommendations
+    from recommendation_engine import compute_similarity, get_recommendations
+
+    memory_monitor.enable_profiling()
+    movie = "Toy Story (1995)"
+    pivot = create_pivot_table()
+    advanced_recommendations(movie, pivot)
+    get_recommendations(movie, pivot, compute_similarity(pivot))
+    print(memory_monitor.stage_report().to_string(index=False))
@@ -0,0 +1,143 @@
+# model_manager.py
+import threading
+import time
+from logger import logger
+
+
+class ModelSnapshot:
+    """
+    A trained, read-only set of models shared by all dashboard sessions.
+    """
+
+    def __init__(self, pivot, correlation, similarity, version, duration):
+        self.pivot = pivot  # users x movies ratings
+        self.correlation = correlation  # Pearson correlations (traditional)
+        self.similarity = similarity  # NMF latent factor similarities (advanced)
+        self.version = version
+        self.duration = duration  # seconds it took to train
+        self.trained_at = time.time()
+        self.movie_titles = sorted(pivot.columns)
+
+
+class ModelManager:
+    """
+    Trains the recommendation models in a background thread and serves the last
+    successfully trained snapshot to every session, so requests never wait on
+    training and concurrent sessions do not train the same models twice.
+
+    Training reuses the cached pipeline stages (pivot, correlation, NMF movie
+    factors), so retraining only recomputes what changed.
+    """
+
+    def __init__(self, min_ratings=100, n_components=20):
+        self.min_ratings = min_ratings
+        self.n_components = n_components
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._state = "idle"
+        self._last_error = None
+        self._version = 0
+
+    def _train(self):
+        from pipeline import run_pipeline
+        from advanced_recommender import movie_similarity
+
+        start = time.perf_counter()
+        try:
+            pivot = run_pipeline("pivot", min_ratings=self.min_ratings)
+            correlation = run_pipeline("correlation", min_ratings=self.min_ratings)
+            movie_factors = run_pipeline(
+                "movie_factors",
+                min_ratings=self.min_ratings,
+                n_components=self.n_components,
+            )
+            similarity = movie_similarity(movie_factors, pivot.columns.tolist())
+            with self._lock:
+                self._version += 1
+                self._snapshot = ModelSnapshot(
+                    pivot,
+                    correlation,
+                    similarity,
+                    self._version,
+                    time.perf_counter() - start,
+                )
+                self._state = "ready"
+                self._last_error = None
+            logger.info("Background training finished (model v%d).", self._version)
+        except Exception as e:
+            with self._lock:
+                self._state = "failed"
+                self._last_error = str(e)
+            logger.error("Background training failed: %s", e)
+
+    def retrain(self):
+        """
+        Starts training in a background thread unless it is already running.
+        Returns True if a new training run was started.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._state = "training"
+            self._thread = threading.Thread(
+                target=self._train, name="model-training", daemon=True
+            )
+            self._thread.start()
+        logger.info("Background model training started.")
+        return True
+
+    def ensure_started(self):
+        """
+        Starts the first training run if no model has been trained or started yet.
+        """
+        with self._lock:
+            needs_training = self._snapshot is None and self._thread is None
+        if needs_training:
+            self.retrain()
+
+    def snapshot(self):
+        """
+        Returns the last successfully trained ModelSnapshot, or None if there is
+        none yet.
+        """
+        with self._lock:
+            return self._snapshot
+
+    def status(self):
+        """
+        Returns the training state (idle, training, ready or failed) with the
+        version, training time and duration of the snapshot being served.
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                "state": self._state,
+                "version": snapshot.version if snapshot else None,
+                "trained_at": snapshot.trained_at if snapshot else None,
+                "duration": snapshot.duration if snapshot else None,
+                "last_error": self._last_error,
+            }
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the current training run finishes (for scripts and tests).
+        """
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_model_manager():
+    """
+    Returns the process-wide ModelManager shared by all sessions.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ModelManager()
+        return _manager
@@ -0,0 +1,109 @@
+# numeric_config.py
+import os
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # ships with scikit-learn; thread limits become no-ops
+    threadpool_limits = None
+
+PRECISIONS = {"float32": np.float32, "float64": np.float64}
+
+# Floating point precision of the pivot, NMF factors and similarity matrices.
+# Can be set with the MOVIE_REC_PRECISION environment variable or set_precision().
+_precision = os.environ.get("MOVIE_REC_PRECISION", "float64")
+if _precision not in PRECISIONS:
+    raise ValueError(
+        f"MOVIE_REC_PRECISION must be one of {sorted(PRECISIONS)}, got '{_precision}'"
+    )
+# BLAS threads per process (None = the BLAS library's default) and worker
+# processes for blocked similarity builds. Set with MOVIE_REC_BLAS_THREADS and
+# MOVIE_REC_WORKERS, or set_blas_threads() and set_worker_count().
+_blas_threads = (
+    int(os.environ["MOVIE_REC_BLAS_THREADS"])
+    if os.environ.get("MOVIE_REC_BLAS_THREADS")
+    else None
+)
+_worker_count = int(os.environ.get("MOVIE_REC_WORKERS") or 1)
+
+
+def set_precision(precision):
+    """
+    Sets the numeric precision, "float32" or "float64".
+    """
+    global _precision
+    if precision not in PRECISIONS:
+        raise ValueError(
+            f"Precision must be one of {sorted(PRECISIONS)}, got '{precision}'"
+        )
+    _precision = precision
+
+
+def get_precision():
+    """
+    Returns the numeric precision name, "float32" or "float64".
+    """
+    return _precision
+
+
+def get_dtype():
+    """
+    Returns the numpy dtype of the configured precision.
+    """
+    return np.dtype(PRECISIONS[_precision])
+
+
+def set_blas_threads(threads):
+    """
+    Sets the number of BLAS threads per process; None restores the library default.
+    """
+    global _blas_threads
+    _blas_threads = threads
+
+
+def get_blas_threads():
+    """
+    Returns the number of BLAS threads per process, or None for the library default.
+    """
+    return _blas_threads
+
+
+def set_worker_count(workers):
+    """
+    Sets the number of worker processes for blocked similarity builds;
+    None uses every CPU.
+    """
+    global _worker_count
+    _worker_count = workers
+
+
+def get_worker_count():
+    """
+    Returns the number of worker processes for blocked similarity builds.
+    """
+    return _worker_count or os.cpu_count()
+
+
+def worker_blas_threads(n_workers):
+    """
+    BLAS threads for each of n_workers processes, splitting the configured BLAS
+    threads (or the CPUs) between them so that they do not oversubscribe the cores.
+    """
+    total = _blas_threads or os.cpu_count() or 1
+    return max(1, total // max(1, n_workers))
+
+
+@contextmanager
+def blas_threads(threads=None):
+    """
+    Limits the BLAS/OpenMP thread pools used by numpy and scikit-learn within the
+    enclosed block to threads (default: the configured BLAS threads). Does
+    nothing if no limit is configured or threadpoolctl is unavailable.
+    """
+    threads = _blas_threads if threads is None else threads
+    if threads is None or threadpool_limits is None:
+        yield
+        return
+    with threadpool_limits(limits=threads):
+        yield
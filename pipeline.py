@@ -0,0 +1,253 @@
+# pipeline.py
+import hashlib
+import json
+import os
+import tempfile
+import joblib
+from memory_monitor import get_memory_budget
+from numeric_config import get_precision
+from logger import logger
+
+# Bump to invalidate every cached artifact after changing a stage's logic
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.environ.get("MOVIE_REC_PIPELINE_CACHE", ".pipeline_cache")
+
+
+class Stage:
+    """
+    A pipeline stage: a function of its upstream stages' outputs (in order)
+    and of its own keyword parameters. files lists the data files it reads.
+    budget_dependent marks stages whose output representation depends on the
+    memory budget; they are only cached when no budget is set.
+    """
+
+    def __init__(
+        self, name, func, inputs=(), params=None, files=(), budget_dependent=False
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = dict(params or {})  # parameter name -> default
+        self.files = tuple(files)
+        self.budget_dependent = budget_dependent
+
+
+def dump_atomic(value, path):
+    """
+    Writes value with joblib to a temporary file next to path and renames it
+    into place, so concurrent readers never load a partially written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        joblib.dump(value, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _load_ratings():
+    from data_preprocessing import load_ratings
+
+    return load_ratings()
+
+
+def _load_movies():
+    from data_preprocessing import load_movies
+
+    return load_movies()
+
+
+def _merge(ratings, movies):
+    from data_preprocessing import merge_data
+
+    return merge_data(ratings, movies)
+
+
+def _filter(data, min_ratings):
+    from data_preprocessing import filter_popular
+
+    return filter_popular(data, min_ratings)
+
+
+def _pivot(data):
+    from data_preprocessing import pivot_ratings
+
+    return pivot_ratings(data)
+
+
+def _correlation(pivot, min_periods):
+    from recommendation_engine import compute_similarity
+
+    return compute_similarity(pivot, min_periods=min_periods)
+
+
+def _kfold_split(ratings, n_folds, shuffle, seed):
+    from data_preprocessing import kfold_assignments
+
+    return kfold_assignments(ratings, n_folds=n_folds, shuffle=shuffle, seed=seed)
+
+
+def _leave_n_out_split(ratings, n_test, skip, max_test):
+    from data_preprocessing import leave_n_out_split
+
+    return leave_n_out_split(ratings, n_test=n_test, skip=skip, max_test=max_test)
+
+
+def _temporal_split(ratings, test_fraction, per_user):
+    from data_preprocessing import temporal_split
+
+    return temporal_split(ratings, test_fraction=test_fraction, per_user=per_user)
+
+
+def _movie_factors(pivot, n_components):
+    from advanced_recommender import fit_movie_factors
+
+    return fit_movie_factors(pivot, n_components)
+
+
+# load -> merge -> filter by min_ratings -> pivot -> correlation / NMF factors,
+# plus train/test splits of the loaded ratings
+STAGES = {
+    stage.name: stage
+    for stage in [
+        Stage("ratings", _load_ratings, files=["data/u.data"]),
+        Stage("movies", _load_movies, files=["data/u.item"]),
+        Stage("merge", _merge, inputs=["ratings", "movies"]),
+        Stage("filter", _filter, inputs=["merge"], params={"min_ratings": 100}),
+        Stage("pivot", _pivot, inputs=["filter"]),
+        # A LazyCorrelation under a memory budget, the dense matrix otherwise
+        Stage(
+            "correlation",
+            _correlation,
+            inputs=["pivot"],
+            params={"min_periods": 100},
+            budget_dependent=True,
+        ),
+        Stage(
+            "movie_factors",
+            _movie_factors,
+            inputs=["pivot"],
+            params={"n_components": 20},
+        ),
+        # Train/test splits of the ratings, stored as index arrays
+        Stage(
+            "kfold_split",
+            _kfold_split,
+            inputs=["ratings"],
+            params={"n_folds": 5, "shuffle": False, "seed": 42},
+        ),
+        Stage(
+            "leave_n_out_split",
+            _leave_n_out_split,
+            inputs=["ratings"],
+            params={"n_test": 10, "skip": 0, "max_test": None},
+        ),
+        Stage(
+            "temporal_split",
+            _temporal_split,
+            inputs=["ratings"],
+            params={"test_fraction": 0.2, "per_user": False},
+        ),
+    ]
+}
+
+
+class Pipeline:
+    """
+    Runs stages on demand and stores each stage's output in cache_dir, keyed by
+    a hash of the stage's parameters, the contents of the files it reads, the
+    numeric precision and the keys of its upstream stages. Changing a parameter
+    therefore only recomputes the stage that uses it and the stages downstream
+    of it.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, stages=None):
+        self.cache_dir = cache_dir
+        self.stages = STAGES if stages is None else stages
+        self._file_hashes = {}  # (path, mtime, size) -> sha256
+        self._memory = {}  # stage name -> (cache key, output) of the last run
+
+    def _file_hash(self, path):
+        stat = os.stat(path)
+        signature = (path, stat.st_mtime_ns, stat.st_size)
+        if signature not in self._file_hashes:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            self._file_hashes[signature] = digest.hexdigest()
+        return self._file_hashes[signature]
+
+    def _stage_params(self, stage, params):
+        return {
+            name: params.get(name, default) for name, default in stage.params.items()
+        }
+
+    def key(self, name, **params):
+        """
+        Returns the cache key of stage name for the given parameters.
+        """
+        stage = self.stages[name]
+        description = {
+            "version": CACHE_VERSION,
+            "precision": get_precision(),
+            "stage": name,
+            "params": self._stage_params(stage, params),
+            "files": [self._file_hash(path) for path in stage.files],
+            "inputs": [self.key(upstream, **params) for upstream in stage.inputs],
+        }
+        encoded = json.dumps(description, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()[:16]
+
+    def run(self, name, **params):
+        """
+        Returns the output of stage name, reusing cached upstream and stage
+        outputs whose keys are unchanged. Parameters not used by a stage are
+        passed through to its upstream stages.
+        """
+        stage = self.stages[name]
+        if stage.budget_dependent and get_memory_budget() is not None:
+            # The representation depends on the budget and current memory use,
+            # so it is neither read from nor written to the cache
+            inputs = [self.run(upstream, **params) for upstream in stage.inputs]
+            logger.info("Pipeline stage '%s' computing (uncached)...", name)
+            return stage.func(*inputs, **self._stage_params(stage, params))
+
+        key = self.key(name, **params)
+        if name in self._memory and self._memory[name][0] == key:
+            return self._memory[name][1]
+
+        path = os.path.join(self.cache_dir, f"{name}-{key}.pkl")
+        if os.path.exists(path):
+            logger.debug("Pipeline stage '%s' loaded from cache (%s)", name, key)
+            output = joblib.load(path)
+        else:
+            inputs = [self.run(upstream, **params) for upstream in stage.inputs]
+            logger.info("Pipeline stage '%s' computing (%s)...", name, key)
+            output = stage.func(*inputs, **self._stage_params(stage, params))
+            os.makedirs(self.cache_dir, exist_ok=True)
+            dump_atomic(output, path)
+        self._memory[name] = (key, output)
+        return output
+
+
+_default_pipeline = None
+
+
+def run_pipeline(name, **params):
+    """
+    Runs stage name on the shared process-wide Pipeline.
+    """
+    global _default_pipeline
+    if _default_pipeline is None:
+        _default_pipeline = Pipeline()
+    return _default_pipeline.run(name, **params)
+
+
+if __name__ == "__main__":
+    pipeline = Pipeline()
+    for name in STAGES:
+        pipeline.run(name)
+        print(f"{name:>14}: {pipeline.key(name)}")
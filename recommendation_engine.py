@@ -1,46 +1,323 @@
-from data_preprocessing import merge_data
+import numpy as np
+import pandas as pd
+from data_preprocessing import genre_filter, sparse_ratings
+from memory_monitor import profile_stage, within_budget
+from numeric_config import blas_threads, get_dtype
+from blocked_similarity import PearsonKernel, blocked_similarity, pearson_from_sums
+from logger import logger
 
 
 def create_pivot_table(min_ratings=100):
     """
     Creates a pivot table (users x movies) with ratings.
     Only movies with at least min_ratings are retained.
+    The pivot comes from the cached pipeline (see pipeline.py).
     """
-    data = merge_data()
+    # Stages up to the pivot are cached and reused across entry points
+    from pipeline import run_pipeline
 
-    # Count number of ratings per movie
-    ratings_count = data.groupby("title")["rating"].count()
-    popular_movies = ratings_count[ratings_count >= min_ratings].index
-    filtered_data = data[data["title"].isin(popular_movies)]
+    return run_pipeline("pivot", min_ratings=min_ratings)
 
-    # Create pivot table: rows = userId, columns = movie title, values = rating
-    pivot = filtered_data.pivot_table(index="userId", columns="title", values="rating")
-    return pivot
+
+def compute_similarity(pivot, min_periods=100):
+    """
+    Computes the Pearson correlation matrix between movies, stored in the
+    configured precision (see numeric_config). If the (n_movies x n_movies)
+    matrix does not fit in the memory budget, a LazyCorrelation is returned
+    instead, which computes each movie's correlations on demand.
+    """
+    n_movies = pivot.shape[1]
+    dtype = get_dtype()
+    with profile_stage("correlation"):
+        # pandas computes in float64 whatever the pivot's dtype
+        if not within_budget(n_movies * n_movies * 8, "correlation"):
+            return LazyCorrelation(pivot, min_periods=min_periods)
+        # Use Pearson correlation and require a minimum number of common users
+        correlation_matrix = pivot.corr(method="pearson", min_periods=min_periods)
+    return correlation_matrix.astype(dtype, copy=False)
 
 
-def compute_similarity(pivot):
+def compute_similarity_blocked(
+    pivot,
+    min_periods=100,
+    top_k=50,
+    block_size=512,
+    n_jobs=None,
+    output_path=None,
+    include_genres=None,
+    exclude_genres=None,
+    keep_kernel=False,
+    titles=None,
+):
     """
-    Computes the Pearson correlation matrix between movies.
+    Computes the Pearson correlations between movies tile by tile with bounded
+    memory. Returns a SimilarityIndex holding each movie's top_k most correlated
+    movies, or, if output_path is given, the full matrix in a memory-mapped file.
+
+    pivot is the (users x movies) pivot table, or a scipy.sparse matrix of the
+    observed ratings (e.g. from fill_ratings or load_sparse_ratings) with titles
+    naming its columns. Either way the correlations are computed from the
+    sparse ratings, without a dense copy of the pivot.
+
+    include_genres/exclude_genres restrict the neighbours kept in a top_k index.
+    Genre filters passed to get_recommendations on an unfiltered top_k index
+    only see each movie's top_k neighbours, unless keep_kernel=True keeps the
+    kernel so that full rows can be computed on demand.
+    """
+    if titles is None:
+        titles = pivot.columns
+        ratings = sparse_ratings(pivot, dtype=get_dtype())
+    else:
+        ratings = pivot
+    kernel = PearsonKernel(ratings, min_periods=min_periods)
+    candidates = None
+    if include_genres or exclude_genres:
+        candidates = genre_filter(titles, include_genres, exclude_genres)
+    return blocked_similarity(
+        kernel,
+        titles,
+        top_k=top_k,
+        block_size=block_size,
+        n_jobs=n_jobs,
+        output_path=output_path,
+        candidates=candidates,
+        keep_kernel=keep_kernel,
+    )
+
+
+class LazyCorrelation:
+    """
+    Pearson correlations computed one movie at a time from the pivot table,
+    without materializing the full (n_movies x n_movies) matrix. Gives the same
+    values as pivot.corr(method="pearson", min_periods=min_periods) and can be
+    passed to get_recommendations in place of the correlation matrix.
+    """
+
+    def __init__(self, pivot, min_periods=100):
+        self.columns = pivot.columns
+        self._kernel = PearsonKernel(
+            sparse_ratings(pivot, dtype=get_dtype()), min_periods=min_periods
+        )
+
+    def __getitem__(self, movie_title):
+        if movie_title not in self.columns:
+            raise ValueError(f"Movie '{movie_title}' not found in the dataset.")
+        k = self.columns.get_loc(movie_title)
+        with blas_threads():
+            corr = self._kernel.tile(slice(0, len(self.columns)), slice(k, k + 1))
+        return pd.Series(corr.ravel(), index=self.columns, name=movie_title)
+
+
+class IncrementalCorrelation:
+    """
+    Incrementally maintained sufficient statistics for Pearson item correlations.
+
+    For every pair of movies that share at least one rater it keeps the co-count
+    and, over those common raters, the sum and sum of squares of each movie's
+    ratings plus the cross-product sum. Only pairs with overlap are stored.
+    Adding a rating touches just the pairs formed with the other movies rated
+    by the same user, and the correlations for a movie are computed on demand
+    from its pair statistics, giving the same values as
+    pivot.corr(method="pearson", min_periods=min_periods).
+
+    The instance exposes columns and item access so it can be passed to
+    get_recommendations in place of a precomputed correlation matrix.
     """
-    # Use Pearson correlation and require a minimum number of common users
-    correlation_matrix = pivot.corr(method="pearson", min_periods=100)
-    return correlation_matrix
 
+    # Layout of a pair entry; "a" is the lexicographically smaller title
+    N, SUM_A, SUM_B, SUMSQ_A, SUMSQ_B, CROSS = range(6)
+
+    def __init__(self, min_periods=100):
+        self.min_periods = min_periods
+        self.user_ratings = {}  # userId -> {title: mean rating}
+        self.rating_totals = {}  # (userId, title) -> [rating sum, rating count]
+        self.item_counts = {}  # title -> number of ratings
+        # title -> {other title: pair entry}; both orientations share one list
+        self.pairs = {}
+
+    @classmethod
+    def from_pivot(cls, pivot, min_periods=100):
+        """
+        Builds the statistics in bulk from a (users x movies) pivot table.
+        Each pivot value counts as a single rating if the same user rates the
+        movie again later.
+        """
+        stats = cls(min_periods=min_periods)
+        titles = list(pivot.columns)
+        # Running sums are kept in float64 whatever the configured precision,
+        # since every added rating accumulates into them
+        values = pivot.to_numpy(dtype=float)
+        rated = ~np.isnan(values)
+        mask = rated.astype(float)
+        filled = np.where(rated, values, 0.0)
+
+        # Entry [i, j] of each product is taken over users who rated both i and j
+        with blas_threads():
+            co_counts = mask.T @ mask
+            sums = filled.T @ mask
+            sumsqs = (filled**2).T @ mask
+            cross = filled.T @ filled
+
+        for user_id, row_rated, row_values in zip(pivot.index, rated, values):
+            stats.user_ratings[user_id] = {
+                titles[k]: row_values[k] for k in np.flatnonzero(row_rated)
+            }
+        for k, title in enumerate(titles):
+            stats.item_counts[title] = int(co_counts[k, k])
+            stats.pairs[title] = {}
+
+        for i, j in zip(*np.nonzero(np.triu(co_counts, k=1))):
+            a, b = (i, j) if titles[i] < titles[j] else (j, i)
+            entry = [
+                co_counts[a, b],
+                sums[a, b],
+                sums[b, a],
+                sumsqs[a, b],
+                sumsqs[b, a],
+                cross[a, b],
+            ]
+            stats.pairs[titles[a]][titles[b]] = entry
+            stats.pairs[titles[b]][titles[a]] = entry
+        return stats
+
+    def add_rating(self, user_id, movie_title, rating):
+        """
+        Records a rating and updates only the pairs between movie_title and the
+        other movies this user has rated. Repeated ratings of a title by the
+        same user are averaged, as pivot_table does.
+        """
+        user = self.user_ratings.setdefault(user_id, {})
+        previous = user.get(movie_title)
+        totals = self.rating_totals.setdefault(
+            (user_id, movie_title), [0.0, 0] if previous is None else [previous, 1]
+        )
+        totals[0] += float(rating)
+        totals[1] += 1
+        rating = totals[0] / totals[1]
+        self.pairs.setdefault(movie_title, {})
+
+        for other, other_rating in user.items():
+            if other == movie_title:
+                continue
+            entry = self.pairs[movie_title].get(other)
+            if entry is None:
+                entry = [0.0] * 6
+                self.pairs[movie_title][other] = entry
+                self.pairs[other][movie_title] = entry
+            if movie_title < other:
+                own_sum, own_sumsq, other_sum, other_sumsq = (
+                    self.SUM_A,
+                    self.SUMSQ_A,
+                    self.SUM_B,
+                    self.SUMSQ_B,
+                )
+            else:
+                own_sum, own_sumsq, other_sum, other_sumsq = (
+                    self.SUM_B,
+                    self.SUMSQ_B,
+                    self.SUM_A,
+                    self.SUMSQ_A,
+                )
+            if previous is None:
+                entry[self.N] += 1
+                entry[other_sum] += other_rating
+                entry[other_sumsq] += other_rating**2
+                entry[own_sum] += rating
+                entry[own_sumsq] += rating**2
+                entry[self.CROSS] += rating * other_rating
+            else:
+                entry[own_sum] += rating - previous
+                entry[own_sumsq] += rating**2 - previous**2
+                entry[self.CROSS] += (rating - previous) * other_rating
+
+        if previous is None:
+            self.item_counts[movie_title] = self.item_counts.get(movie_title, 0) + 1
+        user[movie_title] = rating
 
-def get_recommendations(movie_title, pivot, correlation_matrix, top_n=10):
+    def correlations(self, movie_title):
+        """
+        Returns the Pearson correlations between movie_title and every movie it
+        shares at least min_periods raters with, including itself.
+        """
+        if movie_title not in self.pairs:
+            raise ValueError(f"Movie '{movie_title}' not found in the dataset.")
+        others = self.pairs[movie_title]
+        titles = list(others)
+        entries = np.array(list(others.values()), dtype=float).reshape(-1, 6)
+        own_first = np.array([movie_title < other for other in titles], dtype=bool)
+
+        n = entries[:, self.N]
+        sum_x = np.where(own_first, entries[:, self.SUM_A], entries[:, self.SUM_B])
+        sum_y = np.where(own_first, entries[:, self.SUM_B], entries[:, self.SUM_A])
+        sumsq_x = np.where(
+            own_first, entries[:, self.SUMSQ_A], entries[:, self.SUMSQ_B]
+        )
+        sumsq_y = np.where(
+            own_first, entries[:, self.SUMSQ_B], entries[:, self.SUMSQ_A]
+        )
+
+        corr = pearson_from_sums(
+            n,
+            sum_x,
+            sum_y,
+            sumsq_x,
+            sumsq_y,
+            entries[:, self.CROSS],
+            self.min_periods,
+        )
+
+        result = pd.Series(corr, index=titles, name=movie_title, dtype=float)
+        if self.item_counts.get(movie_title, 0) >= self.min_periods:
+            result[movie_title] = 1.0
+        return result.dropna()
+
+    @property
+    def columns(self):
+        return pd.Index(self.pairs.keys())
+
+    def __getitem__(self, movie_title):
+        return self.correlations(movie_title)
+
+
+def get_recommendations(
+    movie_title,
+    pivot,
+    correlation_matrix,
+    top_n=10,
+    include_genres=None,
+    exclude_genres=None,
+):
     """
     Returns top_n movie recommendations based on item correlation.
+    include_genres/exclude_genres restrict the candidates by genre before the
+    top_n selection.
     """
     if movie_title not in correlation_matrix.columns:
         raise ValueError(f"Movie '{movie_title}' not found in the dataset.")
 
-    # Get the correlation series for the given movie
-    similar_movies = (
-        correlation_matrix[movie_title].dropna().sort_values(ascending=False)
-    )
+    # Get the correlation series for the given movie. A top-K SimilarityIndex
+    # only holds the nearest neighbours, so genre-filtered queries use the full
+    # row when the index can compute it.
+    if (include_genres or exclude_genres) and getattr(
+        correlation_matrix, "kernel", None
+    ) is not None:
+        similar_movies = correlation_matrix.full_row(movie_title).dropna()
+    else:
+        if (include_genres or exclude_genres) and getattr(
+            correlation_matrix, "top_indices", None
+        ) is not None:
+            logger.warning(
+                "Genre filters applied to the top-K neighbours of '%s' only; "
+                "build the index with the same genres or keep_kernel=True to "
+                "get a full top_n.",
+                movie_title,
+            )
+        similar_movies = correlation_matrix[movie_title].dropna()
 
-    # Remove the movie itself and return the top_n
-    recommendations = similar_movies.drop(labels=[movie_title]).head(top_n)
+    # Remove the movie itself and any genre mismatches, then return the top_n
+    keep = genre_filter(similar_movies.index, include_genres, exclude_genres)
+    keep &= similar_movies.index != movie_title
+    recommendations = similar_movies[keep].sort_values(ascending=False).head(top_n)
     return recommendations
 
 